@@ -1,161 +1,431 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context, url_for
 from flask_cors import CORS
+from werkzeug.exceptions import HTTPException
 import base64
-import io
+import functools
+import json
+import logging
 from PIL import Image
-import torch
 import os
-import tempfile
+import time
 import cv2
 import numpy as np
+from concurrent.futures import as_completed
 
 # Import our food vision functions
-from food_vision import get_caption, get_detected_ingredients, generate_recipe
+from food_vision import caption_requests, detect_food_batch, analyze_image, generate_recipe, stream_recipe, combine_ingredients, registry, recipe_cache, search_recipes
+from cascade import SHORT_CAPTION_TOKENS, resolve_budget, run_cascade, stage_costs
+from batching import MicroBatcher
+from result_cache import ResultCache, content_key, perceptual_hash
+from uploads import UploadError, read_image_upload, DEFAULT_MAX_UPLOAD_BYTES
+from image_ingest import decode_image
+from camera import CameraService
+from jobs import JobQueue, QueueFull
+from vocabulary import CAPTION_FOOD_KEYWORDS
+import metrics
+from log_config import configure_logging
+
+configure_logging()
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
+# Uploads larger than this are rejected before the body is read
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", DEFAULT_MAX_UPLOAD_BYTES))
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES
+
+# The capture thread owns the device and keeps the latest frames buffered.
+# CAMERA_SOURCE can be a device index, a video file, or "synthetic".
+camera = CameraService(
+    source=os.environ.get("CAMERA_SOURCE", "0"),
+    buffer_size=int(os.environ.get("CAMERA_BUFFER_FRAMES", "4")),
+)
+
+# Concurrent requests are grouped into micro-batches so the models run one
+# batched forward pass instead of many batch-size-1 passes.
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("BATCH_MAX_WAIT_MS", "10"))
+
+# Caption items are (pixels, deadline) pairs so a budgeted request can cut
+# its batch's generate call short
+caption_batcher = MicroBatcher(caption_requests, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, name="caption")
+detection_batcher = MicroBatcher(detect_food_batch, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, name="detection")
+# Shortened captions for tight latency budgets; a separate batcher since
+# max_new_tokens is per generate call
+short_caption_batcher = MicroBatcher(
+    functools.partial(caption_requests, max_new_tokens=SHORT_CAPTION_TOKENS), BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS,
+    name="caption-short")
+
+# Processed-image results are cached by content hash (and optionally by
+# perceptual hash) so retries and re-submits skip the models entirely.
+result_cache = ResultCache(
+    max_bytes=int(float(os.environ.get("RESULT_CACHE_MAX_MB", "64")) * 1024 * 1024),
+    disk_dir=os.environ.get("RESULT_CACHE_DIR") or None,
+    use_perceptual_hash=os.environ.get("RESULT_CACHE_PHASH", "0") == "1",
+    phash_max_distance=int(os.environ.get("RESULT_CACHE_PHASH_DISTANCE", "4")),
+    max_disk_bytes=int(float(os.environ.get("RESULT_CACHE_DISK_MAX_MB", "512")) * 1024 * 1024),
+)
+
+# Asynchronous jobs: a fixed set of workers and a bounded queue, so overload
+# is rejected with 429 up front instead of timing out.
+job_queue = JobQueue(
+    workers=int(os.environ.get("JOB_WORKERS", "2")),
+    max_queued=int(os.environ.get("JOB_QUEUE_SIZE", "32")),
+    result_ttl=float(os.environ.get("JOB_RESULT_TTL", "600")),
+    # Shared job state for multi-process serving (serve.py sets one up)
+    store_dir=os.environ.get("JOB_STORE_DIR") or None,
+)
+JOB_MAX_WAIT_S = float(os.environ.get("JOB_MAX_WAIT_S", "30"))
+
+def _cache_hits() -> dict:
+    results = result_cache.stats()
+    return {
+        ("result", "memory"): results["hits"],
+        ("result", "perceptual"): results["perceptual_hits"],
+        ("result", "disk"): results["disk_hits"],
+        ("recipe", "memory"): recipe_cache.stats()["hits"],
+    }
+
+def _cache_misses() -> dict:
+    return {("result",): result_cache.stats()["misses"], ("recipe",): recipe_cache.stats()["misses"]}
+
+metrics.registry.callback(
+    "recipesnap_cache_hits_total", "Cache hits, by cache and tier.", ("cache", "tier"), _cache_hits, "counter")
+metrics.registry.callback(
+    "recipesnap_cache_misses_total", "Cache misses, by cache.", ("cache",), _cache_misses, "counter")
+
+@app.before_request
+def _track_request_start():
+    metrics.IN_FLIGHT.inc(endpoint=request.endpoint or "unknown")
+
+@app.after_request
+def _count_request(response):
+    metrics.REQUESTS.inc(endpoint=request.endpoint or "unknown", status=response.status_code)
+    return response
+
+@app.teardown_request
+def _track_request_end(error=None):
+    # Runs after streamed responses finish, and even if the view raised
+    metrics.IN_FLIGHT.dec(endpoint=request.endpoint or "unknown")
+
+def build_result(caption: str, ingredients: list, recipe: str, detection_scores: dict) -> dict:
+    # Create detection results for frontend, with the detector's own confidences
+    detection_results = []
+    for label, score in detection_scores.items():
+        detection_results.append({
+            "label": label,
+            "score": round(score, 4)
+        })
+    
+    # Create caption result in expected format
+    caption_result = [{"generated_text": caption}]
+    
+    return {
+        "caption": caption,
+        "ingredients": ingredients,
+        "recipe": recipe,
+        "detectionResults": detection_results,
+        "foodKeywords": CAPTION_FOOD_KEYWORDS,
+        "captionResult": caption_result
+    }
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({"status": "ok", "message": "Food Vision API is running"})
 
+@app.route('/api/health/live', methods=['GET'])
+def liveness_check():
+    """The process is up and serving; models may still be loading."""
+    return jsonify({"status": "ok"})
+
+@app.route('/api/health/ready', methods=['GET'])
+def readiness_check():
+    """Ready once all required models are loaded; 503 until then."""
+    ready = registry.ready()
+    body = {"status": "ready" if ready else "loading", "models": registry.status()}
+    return jsonify(body), (200 if ready else 503)
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify({"results": result_cache.stats(), "recipes": recipe_cache.stats(), "stage_costs": stage_costs.snapshot()})
+
+@app.route('/api/recipes/search', methods=['GET'])
+def recipe_search():
+    """Corpus recipes matching ``?ingredients=potato,onion`` (``&k=`` for how many)."""
+    ingredients = [item.strip() for item in request.args.get("ingredients", "").split(",") if item.strip()]
+    if not ingredients:
+        return jsonify({"error": "ingredients is required"}), 400
+    k = min(max(request.args.get("k", 5, type=int), 1), 50)
+    return jsonify({"ingredients": ingredients, "matches": search_recipes(ingredients, k)})
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus text-format metrics."""
+    return Response(metrics.registry.render(), mimetype=metrics.CONTENT_TYPE)
+
+def run_pipeline(image_bytes: bytes, budget_s: float = None) -> dict:
+    """Caption, detect and generate a recipe for one uploaded image.
+
+    Shared by the synchronous endpoint and the job workers; results are
+    served from and stored in the result cache. ``budget_s`` (None = no
+    limit) is the latency budget the cascade plans the stages against; the
+    response lists in ``stages`` which stages ran and what each cost.
+    """
+    start = time.perf_counter()
+    deadline = start + budget_s if budget_s is not None else None
+    cache_key = None
+    if result_cache.enabled:
+        cache_key = content_key(image_bytes)
+        # With perceptual matching, the miss is counted by get_similar below
+        cached = result_cache.get(cache_key, count_miss=not result_cache.use_perceptual_hash)
+        if cached is not None:
+            metrics.STAGE_SECONDS.observe(time.perf_counter() - start, stage="total")
+            return dict(cached, stages=[{"stage": "cache", "ran": True, "ms": round((time.perf_counter() - start) * 1000, 1)}])
+    
+    # Decode once here rather than on the shared batch workers, straight to
+    # the resolution the models use
+    pixels, decode_info = decode_image(image_bytes)
+    metrics.STAGE_SECONDS.observe(decode_info["decode_ms"] / 1000, stage="decode")
+    logger.debug("Decoded image", extra=decode_info)
+    
+    phash = None
+    if result_cache.enabled and result_cache.use_perceptual_hash:
+        phash = perceptual_hash(Image.fromarray(pixels))
+        cached = result_cache.get_similar(phash)
+        if cached is not None:
+            metrics.STAGE_SECONDS.observe(time.perf_counter() - start, stage="total")
+            return dict(cached, stages=[{"stage": "cache", "ran": True, "ms": round((time.perf_counter() - start) * 1000, 1)}])
+    
+    # Both models run on their batch workers; with a budget, the cascade
+    # may skip or shorten captioning and GPT-2
+    caption, detection_scores, ingredients, recipe, stages = run_cascade(
+        pixels, deadline, caption_batcher, short_caption_batcher, detection_batcher)
+    logger.debug("Caption: %s", caption)
+    logger.debug("Detected objects: %s", detection_scores)
+    logger.debug("Final ingredients list: %s", ingredients)
+    
+    result = build_result(caption, ingredients, recipe, detection_scores)
+    # Only full-quality results are cached, so a rushed answer is never
+    # served to a request that had time for the whole pipeline
+    if cache_key is not None and deadline is None:
+        result_cache.put(cache_key, result, phash)
+    
+    metrics.STAGE_SECONDS.observe(time.perf_counter() - start, stage="total")
+    stages.insert(0, {"stage": "decode", "ran": True, "ms": decode_info["decode_ms"]})
+    return dict(result, stages=stages, budgetMs=round(budget_s * 1000) if budget_s is not None else None)
+
+def _request_budget(req) -> float:
+    """Latency budget from ``budget_ms``/``tier`` (query string or form) or the
+    X-Latency-Budget-Ms / X-Quality-Tier headers."""
+    budget_ms = req.args.get("budget_ms") or req.form.get("budget_ms") or req.headers.get("X-Latency-Budget-Ms")
+    tier = req.args.get("tier") or req.form.get("tier") or req.headers.get("X-Quality-Tier")
+    try:
+        return resolve_budget(tier, float(budget_ms) if budget_ms else None)
+    except ValueError as e:
+        raise UploadError(str(e), 400)
+
 @app.route('/api/process-image', methods=['POST'])
 def process_image():
     try:
-        data = request.json
-        if not data or 'image' not in data:
-            return jsonify({"error": "No image data provided"}), 400
-        
-        # Decode base64 image
-        image_data = data['image']
-        if image_data.startswith('data:image'):
-            # Remove the prefix if present (e.g., 'data:image/jpeg;base64,')
-            image_data = image_data.split(',')[1]
-        
-        image_bytes = base64.b64decode(image_data)
-        image = Image.open(io.BytesIO(image_bytes))
-        
-        # Process the image
-        print("Generating caption...")
-        caption = get_caption(image)
-        print(f"Caption: {caption}")
-        
-        print("Detecting ingredients...")
-        detected_objects = get_detected_ingredients(image)
-        print(f"Detected objects: {detected_objects}")
-        
-        # Extract potential food items from caption
-        food_keywords = ["potato", "tomato", "onion", "garlic", "chicken", "beef", "carrot", 
-                        "broccoli", "spinach", "rice", "pasta", "cheese", "egg", "mushroom",
-                        "bell pepper", "olive oil", "salt", "pepper", "basil", "oregano", "food",
-                        "dish", "meal", "vegetable", "fruit", "meat"]
-        
-        caption_ingredients = []
-        for word in caption.lower().split():
-            if word in food_keywords or any(keyword in word for keyword in food_keywords):
-                caption_ingredients.append(word)
-        
-        # Combine detected objects with caption words for ingredients
-        all_ingredients = detected_objects + caption_ingredients
-        
-        # Clean up ingredients - remove duplicates and non-food items
-        common_non_food = ['a', 'the', 'and', 'with', 'of', 'in', 'on', 'plate', 'bowl', 'dish', 'image']
-        ingredients = []
-        for item in all_ingredients:
-            if len(item) > 2 and item.lower() not in common_non_food:
-                ingredients.append(item)
-        
-        # Remove duplicates
-        ingredients = list(set(ingredients))
-        
-        # If no ingredients detected, add some default ones based on the image type
-        if not ingredients:
-            print("No ingredients detected, adding defaults based on caption")
-            if "potato" in caption.lower():
-                ingredients = ["potato", "butter", "salt", "pepper", "garlic"]
-            else:
-                ingredients = ["vegetable", "salt", "pepper", "olive oil"]
-        
-        print(f"Final ingredients list: {ingredients}")
-        
-        # Generate recipe
-        recipe = generate_recipe(ingredients)
-        
-        # Create detection results for frontend
-        detection_results = []
-        for ingredient in ingredients:
-            detection_results.append({
-                "label": ingredient,
-                "score": 0.9  # Default high confidence
-            })
-        
-        # Create caption result in expected format
-        caption_result = [{"generated_text": caption}]
-        
-        return jsonify({
-            "caption": caption,
-            "ingredients": ingredients,
-            "recipe": recipe,
-            "detectionResults": detection_results,
-            "foodKeywords": food_keywords,
-            "captionResult": caption_result
-        })
+        # Multipart, raw binary, or legacy base64-in-JSON
+        try:
+            # The upload first: it enforces the size limit before the form
+            # (which may hold budget_ms) is parsed
+            image_bytes = read_image_upload(request, MAX_UPLOAD_BYTES)
+            budget_s = _request_budget(request)
+            return jsonify(run_pipeline(image_bytes, budget_s))
+        except UploadError as e:
+            return jsonify({"error": str(e)}), e.status
     
+    except HTTPException as e:
+        return jsonify({"error": e.description}), e.code
     except Exception as e:
-        print(f"Error processing image: {str(e)}")
+        logger.exception("Error processing image: %s", e)
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """Queue an image for processing and return its job id right away.
+
+    Accepts the same uploads as /api/process-image. Responds 202 with the job
+    id and a status URL to poll, or 429 with Retry-After when the queue is full.
+    """
+    try:
+        image_bytes = read_image_upload(request, MAX_UPLOAD_BYTES)
+        budget_s = _request_budget(request)
+    except UploadError as e:
+        return jsonify({"error": str(e)}), e.status
+    
+    try:
+        job = job_queue.submit(run_pipeline, image_bytes, budget_s)
+    except QueueFull as e:
+        response = jsonify({"error": str(e), "retryAfter": e.retry_after})
+        response.headers["Retry-After"] = str(e.retry_after)
+        return response, 429
+    
+    status_url = url_for("job_status", job_id=job.id)
+    body = dict(job.to_dict(), statusUrl=status_url)
+    return jsonify(body), 202, {"Location": status_url}
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Job status, with the result once done.
+
+    ``?wait=N`` long-polls: the response is held for up to N seconds (capped
+    at JOB_MAX_WAIT_S) until the job finishes, so clients learn of completion
+    without polling in a loop.
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job id"}), 404
+    wait = min(request.args.get("wait", 0, type=float), JOB_MAX_WAIT_S)
+    if wait > 0:
+        job.wait(wait)
+    return jsonify(job.to_dict())
+
+@app.route('/api/jobs/stats', methods=['GET'])
+def job_stats():
+    return jsonify(job_queue.stats())
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/api/process-image/stream', methods=['POST'])
+def process_image_stream():
+    """Same pipeline as /api/process-image, streamed as Server-Sent Events.
+
+    Events, in order: ``caption`` and ``detections`` (whichever model finishes
+    first), ``ingredients``, then ``token`` for each piece of recipe text as it
+    is generated, and ``done`` with the full result. ``reset`` means discard
+    the recipe text streamed so far because a template follows; ``error``
+    ends the stream on failure.
+    """
+    try:
+        image_bytes = read_image_upload(request, MAX_UPLOAD_BYTES)
+    except UploadError as e:
+        return jsonify({"error": str(e)}), e.status
+    
+    cache_key = content_key(image_bytes) if result_cache.enabled else None
+    
+    def events():
+        start = time.perf_counter()
+        try:
+            cached = result_cache.get(cache_key) if cache_key is not None else None
+            if cached is not None:
+                yield _sse("caption", {"caption": cached["caption"]})
+                yield _sse("ingredients", {"ingredients": cached["ingredients"]})
+                yield _sse("token", {"text": cached["recipe"]})
+                metrics.STAGE_SECONDS.observe(time.perf_counter() - start, stage="total")
+                yield _sse("done", cached)
+                return
+            
+            pixels, decode_info = decode_image(image_bytes)
+            metrics.STAGE_SECONDS.observe(decode_info["decode_ms"] / 1000, stage="decode")
+            caption_future = caption_batcher.submit((pixels, None))
+            detection_future = detection_batcher.submit(pixels)
+            for future in as_completed([caption_future, detection_future]):
+                if future is caption_future:
+                    yield _sse("caption", {"caption": future.result()})
+                else:
+                    yield _sse("detections", {"detected": future.result()})
+            caption = caption_future.result()
+            detection_scores = detection_future.result()
+            
+            ingredients = combine_ingredients(caption, list(detection_scores))
+            yield _sse("ingredients", {"ingredients": ingredients})
+            
+            recipe = ""
+            for event, text in stream_recipe(ingredients):
+                if event == "token":
+                    yield _sse("token", {"text": text})
+                elif event == "reset":
+                    yield _sse("reset", {})
+                else:
+                    recipe = text
+            
+            result = build_result(caption, ingredients, recipe, detection_scores)
+            if cache_key is not None:
+                result_cache.put(cache_key, result)
+            metrics.STAGE_SECONDS.observe(time.perf_counter() - start, stage="total")
+            yield _sse("done", result)
+        
+        except Exception as e:
+            logger.exception("Error streaming image result: %s", e)
+            yield _sse("error", {"error": str(e)})
+    
+    # X-Accel-Buffering stops nginx-style proxies from buffering the stream
+    return Response(stream_with_context(events()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route('/api/webcam/start', methods=['POST'])
+def start_camera():
+    camera.start()
+    return jsonify(camera.status())
+
+@app.route('/api/webcam/stop', methods=['POST'])
+def stop_camera():
+    camera.stop()
+    return jsonify(camera.status())
+
+@app.route('/api/webcam/status', methods=['GET'])
+def camera_status():
+    return jsonify(camera.status())
+
 @app.route('/api/webcam', methods=['GET'])
 def start_webcam():
     """Endpoint to start webcam capture and processing"""
     try:
-        # Create a temporary file to store the captured image
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
-            temp_path = temp_file.name
-        
-        cap = cv2.VideoCapture(0)
-        if not cap.isOpened():
-            return jsonify({"error": "Could not open webcam"}), 500
+        timings = {}
+        start = time.perf_counter()
+        # The capture service starts on first use and then stays running
+        camera.start()
+        try:
+            frame, captured_at = camera.latest()
+        except RuntimeError as e:
+            return jsonify({"error": f"Could not capture frame: {e}"}), 500
+        timings["capture_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        timings["frame_age_ms"] = round((time.time() - captured_at) * 1000, 1)
         
-        # Capture a single frame
-        ret, frame = cap.read()
-        cap.release()
-        
-        if not ret:
-            return jsonify({"error": "Failed to capture frame"}), 500
-        
-        # Save the frame to the temporary file
-        cv2.imwrite(temp_path, frame)
+        # The frame stays in memory: one colour conversion for the models and
+        # one JPEG encode for the response, no temp file round trip.
+        start = time.perf_counter()
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        ok, jpeg = cv2.imencode('.jpg', frame)
+        if not ok:
+            return jsonify({"error": "Failed to encode frame"}), 500
+        img_base64 = base64.b64encode(jpeg).decode('utf-8')
+        timings["frame_encode_ms"] = round((time.perf_counter() - start) * 1000, 1)
         
+        start = time.perf_counter()
         # Process the image
-        image = Image.open(temp_path)
-        caption = get_caption(image)
-        detected_objects = get_detected_ingredients(image)
+        caption, detected_objects = analyze_image(rgb_frame)
+        timings["inference_ms"] = round((time.perf_counter() - start) * 1000, 1)
         
         # Combine detected objects with caption words for ingredients
         ingredients = list(set(detected_objects + caption.split()))
         
         # Generate recipe
+        start = time.perf_counter()
         recipe = generate_recipe(ingredients)
-        
-        # Convert the image to base64 for sending back to the client
-        with open(temp_path, "rb") as img_file:
-            img_base64 = base64.b64encode(img_file.read()).decode('utf-8')
-        
-        # Clean up the temporary file
-        os.unlink(temp_path)
+        timings["recipe_ms"] = round((time.perf_counter() - start) * 1000, 1)
         
         return jsonify({
             "image": f"data:image/jpeg;base64,{img_base64}",
             "caption": caption,
             "ingredients": ingredients,
-            "recipe": recipe
+            "recipe": recipe,
+            "timings": timings
         })
     
     except Exception as e:
-        print(f"Error with webcam: {str(e)}")
+        logger.exception("Error with webcam: %s", e)
         return jsonify({"error": str(e)}), 500
 
 if __name__ == '__main__':
-    print("Starting Food Vision API server...")
+    logger.info("Starting Food Vision API server...")
+    # Load models in the background so the server accepts connections right
+    # away. Under the debug reloader only the child process serves requests.
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        registry.warm_up()
     app.run(host='0.0.0.0', port=5002, debug=True)
@@ -1,19 +1,33 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 import base64
-import io
 from PIL import Image
 import os
-import tempfile
+import time
 import cv2
 import numpy as np
 
 # Import our lightweight food vision functions
 from food_vision_lite import get_caption, get_detected_ingredients, generate_recipe
+from uploads import UploadError, read_image_upload, DEFAULT_MAX_UPLOAD_BYTES
+from image_ingest import decode_image
+from camera import CameraService
+from vocabulary import LITE_CAPTION_STOP_WORDS
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
+# Uploads larger than this are rejected before the body is read
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", DEFAULT_MAX_UPLOAD_BYTES))
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES
+
+# The capture thread owns the device and keeps the latest frames buffered.
+# CAMERA_SOURCE can be a device index, a video file, or "synthetic".
+camera = CameraService(
+    source=os.environ.get("CAMERA_SOURCE", "0"),
+    buffer_size=int(os.environ.get("CAMERA_BUFFER_FRAMES", "4")),
+)
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({"status": "ok", "message": "Food Vision API (Lite Version) is running"})
@@ -21,27 +35,21 @@ def health_check():
 @app.route('/api/process-image', methods=['POST'])
 def process_image():
     try:
-        data = request.json
-        if not data or 'image' not in data:
-            return jsonify({"error": "No image data provided"}), 400
-        
-        # Decode base64 image
-        image_data = data['image']
-        if image_data.startswith('data:image'):
-            # Remove the prefix if present (e.g., 'data:image/jpeg;base64,')
-            image_data = image_data.split(',')[1]
-        
-        image_bytes = base64.b64decode(image_data)
-        image = Image.open(io.BytesIO(image_bytes))
+        # Multipart, raw binary, or legacy base64-in-JSON
+        try:
+            image_bytes = read_image_upload(request, MAX_UPLOAD_BYTES)
+            pixels, _ = decode_image(image_bytes)
+        except UploadError as e:
+            return jsonify({"error": str(e)}), e.status
+        image = Image.fromarray(pixels)
         
         # Process the image
         caption = get_caption(image)
         detected_objects = get_detected_ingredients(image)
         
         # Filter out non-food words from caption
-        caption_words = [word.lower() for word in caption.split() 
-                        if len(word) > 3 and word.lower() not in 
-                        ['with', 'and', 'the', 'that', 'this', 'there', 'their', 'they', 'them']]
+        caption_words = [word for word in (w.lower() for w in caption.split())
+                         if len(word) > 3 and word not in LITE_CAPTION_STOP_WORDS]
         
         # Combine detected objects with caption words for ingredients
         ingredients = list(set(detected_objects + caption_words))
@@ -59,51 +67,66 @@ def process_image():
         print(f"Error processing image: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/webcam/start', methods=['POST'])
+def start_camera():
+    camera.start()
+    return jsonify(camera.status())
+
+@app.route('/api/webcam/stop', methods=['POST'])
+def stop_camera():
+    camera.stop()
+    return jsonify(camera.status())
+
+@app.route('/api/webcam/status', methods=['GET'])
+def camera_status():
+    return jsonify(camera.status())
+
 @app.route('/api/webcam', methods=['GET'])
 def start_webcam():
     """Endpoint to start webcam capture and processing"""
     try:
-        # Create a temporary file to store the captured image
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
-            temp_path = temp_file.name
-        
-        cap = cv2.VideoCapture(0)
-        if not cap.isOpened():
-            return jsonify({"error": "Could not open webcam"}), 500
-        
-        # Capture a single frame
-        ret, frame = cap.read()
-        cap.release()
-        
-        if not ret:
-            return jsonify({"error": "Failed to capture frame"}), 500
-        
-        # Save the frame to the temporary file
-        cv2.imwrite(temp_path, frame)
-        
+        timings = {}
+        start = time.perf_counter()
+        # The capture service starts on first use and then stays running
+        camera.start()
+        try:
+            frame, captured_at = camera.latest()
+        except RuntimeError as e:
+            return jsonify({"error": f"Could not capture frame: {e}"}), 500
+        timings["capture_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        timings["frame_age_ms"] = round((time.time() - captured_at) * 1000, 1)
+        
+        # The frame stays in memory: one colour conversion for the models and
+        # one JPEG encode for the response, no temp file round trip.
+        start = time.perf_counter()
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        ok, jpeg = cv2.imencode('.jpg', frame)
+        if not ok:
+            return jsonify({"error": "Failed to encode frame"}), 500
+        img_base64 = base64.b64encode(jpeg).decode('utf-8')
+        timings["frame_encode_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        
+        start = time.perf_counter()
         # Process the image
-        image = Image.open(temp_path)
+        image = Image.fromarray(rgb_frame)
         caption = get_caption(image)
         detected_objects = get_detected_ingredients(image)
+        timings["inference_ms"] = round((time.perf_counter() - start) * 1000, 1)
         
         # Combine detected objects with caption words for ingredients
         ingredients = list(set(detected_objects + caption.split()))
         
         # Generate recipe
+        start = time.perf_counter()
         recipe = generate_recipe(ingredients)
-        
-        # Convert the image to base64 for sending back to the client
-        with open(temp_path, "rb") as img_file:
-            img_base64 = base64.b64encode(img_file.read()).decode('utf-8')
-        
-        # Clean up the temporary file
-        os.unlink(temp_path)
+        timings["recipe_ms"] = round((time.perf_counter() - start) * 1000, 1)
         
         return jsonify({
             "image": f"data:image/jpeg;base64,{img_base64}",
             "caption": caption,
             "ingredients": ingredients,
-            "recipe": recipe
+            "recipe": recipe,
+            "timings": timings
         })
     
     except Exception as e:
@@ -0,0 +1,271 @@
+"""Per-stage latency and throughput benchmark for the recognition pipeline.
+
+Runs a fixed image set through one backend and reports p50/p95/p99 latency
+per stage, images/sec at several concurrency levels and peak RSS, as JSON so
+runs can be compared across commits. The full backend runs through the
+server's micro-batchers and cascade, so higher concurrency levels measure
+batching as served; it reports the cascade's stages (decode, detect, caption,
+recipe), and since caption and detection run side by side, each is wall time
+from submit and includes queueing and the overlap with the other. The lite
+backend runs its stages one after another and also times the ingredient
+filter:
+
+    python benchmark.py --tiny --output bench.json
+    python benchmark.py --backend lite --images path/to/sample_images
+    python benchmark.py --backend mock --concurrency 1,4,16
+
+Always runs offline: models come from the local Hugging Face cache, or with
+``--tiny`` from tiny randomly initialized models (see tiny_models.py), which
+measure the pipeline's own overhead rather than real model cost.
+"""
+import argparse
+import base64
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Before anything imports transformers
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+import numpy as np
+from PIL import Image
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def synthetic_images(count: int, size: tuple, seed: int) -> list:
+    """JPEG bytes for ``count`` seeded images: smooth colour blobs over noise."""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    yy, xx = np.mgrid[0:height, 0:width]
+    images = []
+    for _ in range(count):
+        pixels = rng.integers(0, 40, size=(height, width, 3)).astype(np.float32)
+        for _ in range(4):
+            cx, cy = rng.uniform(0, width), rng.uniform(0, height)
+            radius = rng.uniform(0.1, 0.4) * min(width, height)
+            blob = np.exp(-((xx - cx) ** 2 + (yy - cy) ** 2) / (2 * radius ** 2))
+            pixels += blob[..., None] * rng.uniform(60, 215, size=3)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels.clip(0, 255).astype(np.uint8)).save(buffer, format="JPEG", quality=90)
+        images.append(buffer.getvalue())
+    return images
+
+
+def load_images(directory: str, limit: int) -> list:
+    paths = sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )[:limit]
+    images = []
+    for path in paths:
+        with open(path, "rb") as f:
+            images.append(f.read())
+    return images
+
+
+def _timed(timings: dict, stage: str, fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    timings[stage] = time.perf_counter() - start
+    return result
+
+
+def full_pipeline(tiny: bool):
+    # The server's own batchers and cascade, so concurrent runs are
+    # micro-batched exactly as concurrent requests would be
+    import app as server
+    import food_vision
+    from cascade import run_cascade
+    from image_ingest import decode_image
+    from recipe_cache import RecipeCache
+
+    if tiny:
+        import tiny_models
+        tiny_models.register_tiny_models(food_vision.registry)
+    # Every recipe should be generated, not served from the cache
+    food_vision.recipe_cache = RecipeCache(max_entries=0)
+    # Load up front so load time is not counted as inference time
+    food_vision.registry.load_all()
+
+    def run(data: bytes) -> dict:
+        timings = {}
+        start = time.perf_counter()
+        pixels = _timed(timings, "decode", lambda: decode_image(data)[0])
+        *_, stages = run_cascade(pixels, None, server.caption_batcher, server.short_caption_batcher,
+                                 server.detection_batcher)
+        for stage in stages:
+            timings[stage["stage"]] = stage["ms"] / 1000.0
+        # Caption and detection overlap, so the stages do not add up
+        timings["total"] = time.perf_counter() - start
+        return timings
+
+    return run
+
+
+def lite_pipeline(tiny: bool):
+    if tiny:
+        raise SystemExit("--tiny is only supported by the full backend")
+    # Loads its models at import time
+    import food_vision_lite
+
+    def run(data: bytes) -> dict:
+        timings = {}
+        image = _timed(timings, "decode", lambda: Image.open(io.BytesIO(data)).convert("RGB"))
+        caption = _timed(timings, "caption", food_vision_lite.get_caption, image)
+        detected = _timed(timings, "detect", food_vision_lite.get_detected_ingredients, image)
+        ingredients = _timed(timings, "filter", lambda: list(set(detected + caption.split())))
+        _timed(timings, "recipe", food_vision_lite.generate_recipe, ingredients)
+        return timings
+
+    return run
+
+
+def mock_pipeline(tiny: bool):
+    import mock_backend
+
+    client = mock_backend.app.test_client()
+
+    def run(data: bytes) -> dict:
+        # The mock does everything in one handler, so it is timed as one request
+        timings = {}
+        payload = {"image": "data:image/jpeg;base64," + base64.b64encode(data).decode("ascii")}
+        response = _timed(timings, "request", client.post, "/api/process-image", json=payload)
+        if response.status_code != 200:
+            raise RuntimeError(f"Mock backend returned {response.status_code}")
+        return timings
+
+    return run
+
+
+PIPELINES = {"full": full_pipeline, "lite": lite_pipeline, "mock": mock_pipeline}
+
+# How to read each backend's stage timings, copied into the report
+STAGE_NOTES = {
+    "full": "caption and detect run concurrently through the micro-batchers; each is wall time from submit, "
+            "including batch wait and overlap with the other, so stages do not add up to total",
+    "lite": "stages run sequentially",
+    "mock": "one request per image, timed as a whole",
+}
+
+
+def percentiles(samples: list) -> dict:
+    values = np.asarray(samples) * 1000.0
+    return {
+        "count": len(samples),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "max_ms": round(float(values.max()), 3),
+    }
+
+
+def measure_latency(run, images: list, repeat: int) -> dict:
+    samples = {}
+    for _ in range(repeat):
+        for data in images:
+            timings = run(data)
+            timings.setdefault("total", sum(timings.values()))
+            for stage, seconds in timings.items():
+                samples.setdefault(stage, []).append(seconds)
+    return {stage: percentiles(values) for stage, values in samples.items()}
+
+
+def measure_throughput(run, images: list, concurrency: int, repeat: int) -> dict:
+    work = images * repeat
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        list(pool.map(run, work))
+        elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "images": len(work),
+        "seconds": round(elapsed, 3),
+        "images_per_sec": round(len(work) / elapsed, 3),
+    }
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL, text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=sorted(PIPELINES), default="full")
+    parser.add_argument("--tiny", action="store_true", help="Use tiny randomly initialized models (full backend only)")
+    parser.add_argument("--images", help="Directory of images to use instead of the synthetic set")
+    parser.add_argument("--count", type=int, default=16, help="Number of images (synthetic set size, or limit for --images)")
+    parser.add_argument("--size", default="640x480", help="Synthetic image size as WIDTHxHEIGHT")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--warmup", type=int, default=2, help="Untimed runs before measuring")
+    parser.add_argument("--repeat", type=int, default=1, help="Passes over the image set per measurement")
+    parser.add_argument("--concurrency", default="1,2,4,8", help="Comma-separated concurrency levels for throughput")
+    parser.add_argument("--output", help="Write the JSON report here as well as to stdout")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    if args.images:
+        images = load_images(args.images, args.count)
+        if not images:
+            parser.error(f"No images found in {args.images}")
+    else:
+        width, height = (int(v) for v in args.size.lower().split("x"))
+        images = synthetic_images(args.count, (width, height), args.seed)
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+
+    load_start = time.perf_counter()
+    run = PIPELINES[args.backend](args.tiny)
+    load_seconds = time.perf_counter() - load_start
+
+    for i in range(args.warmup):
+        run(images[i % len(images)])
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+        },
+        "backend": args.backend,
+        "images": len(images),
+        "load_seconds": round(load_seconds, 3),
+        "latency": measure_latency(run, images, args.repeat),
+        "latency_notes": STAGE_NOTES[args.backend],
+        "throughput": [measure_throughput(run, images, level, args.repeat) for level in levels],
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
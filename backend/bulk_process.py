@@ -0,0 +1,186 @@
+"""Caption and extract ingredients for a whole photo archive, offline.
+
+Walks a directory (or reads a manifest listing one image path per line),
+decodes images in a pool of worker processes, runs captioning and detection
+in batches, and appends one JSON object per image to a JSONL file:
+
+    python bulk_process.py photos/ --output photos.jsonl
+    python bulk_process.py manifest.txt --output out.jsonl --batch-size 16 --recipes
+
+Interrupted runs resume where they stopped: images already present in the
+output file are skipped (failed ones too, unless ``--retry-errors``).
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import food_vision
+from image_ingest import DEFAULT_MAX_PIXELS, decode_image
+from log_config import configure_logging
+
+logger = logging.getLogger("bulk_process")
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def list_images(source: str) -> list:
+    """Image paths under a directory, or listed in a manifest file."""
+    if os.path.isdir(source):
+        paths = []
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            paths.extend(os.path.join(root, name) for name in sorted(files) if name.lower().endswith(IMAGE_EXTENSIONS))
+        return paths
+    base = os.path.dirname(source)
+    with open(source, "r", encoding="utf-8") as f:
+        lines = [line.strip() for line in f]
+    # Relative manifest entries are relative to the manifest itself
+    return [line if os.path.isabs(line) else os.path.join(base, line) for line in lines if line and not line.startswith("#")]
+
+
+def completed_paths(output: str, retry_errors: bool) -> set:
+    """Paths already recorded in an existing output file."""
+    done = set()
+    if not os.path.exists(output):
+        return done
+    with open(output, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # A line cut short by the interruption
+            if retry_errors and "error" in record:
+                continue
+            done.add(record["path"])
+    return done
+
+
+def decode(path: str, max_pixels: int) -> tuple:
+    """Runs in a worker process: ``(path, pixels, None)`` or ``(path, None, error)``.
+
+    Images are decoded at the resolution the models use, which is also much
+    cheaper to send back to the parent than a full-size archive photo.
+    """
+    try:
+        with open(path, "rb") as f:
+            pixels, _ = decode_image(f, max_pixels=max_pixels)
+        return path, pixels, None
+    except Exception as e:
+        return path, None, f"{type(e).__name__}: {e}"
+
+
+def decoded_batches(pool: ProcessPoolExecutor, paths: list, batch_size: int, max_pixels: int, prefetch: int):
+    """Yield lists of decode results, keeping at most ``prefetch`` decodes in flight."""
+    pending = deque()
+    path_iter = iter(paths)
+    batch = []
+    while True:
+        while len(pending) < prefetch:
+            path = next(path_iter, None)
+            if path is None:
+                break
+            pending.append(pool.submit(decode, path, max_pixels))
+        if not pending:
+            break
+        batch.append(pending.popleft().result())
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def process_batch(batch: list, caption_pool: ThreadPoolExecutor, recipes: bool) -> list:
+    records = [{"path": path, "error": error} for path, pixels, error in batch if error is not None]
+    images = [(path, pixels) for path, pixels, error in batch if error is None]
+    if not images:
+        return records
+    pixels = [p for _, p in images]
+    try:
+        # Caption and detection run side by side, as in analyze_image
+        caption_future = caption_pool.submit(food_vision.get_captions, pixels)
+        detections = food_vision.detect_food_batch(pixels)
+        captions = caption_future.result()
+    except Exception as e:
+        logger.warning("Batch of %d failed (%s), marking its images as errors", len(images), e)
+        return records + [{"path": path, "error": f"{type(e).__name__}: {e}"} for path, _ in images]
+
+    for (path, _), caption, detected in zip(images, captions, detections):
+        record = {
+            "path": path,
+            "caption": caption,
+            "ingredients": food_vision.combine_ingredients(caption, list(detected)),
+            "detections": {label: round(score, 4) for label, score in detected.items()},
+        }
+        if recipes:
+            record["recipe"] = food_vision.generate_recipe(record["ingredients"])
+        records.append(record)
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="Directory of images, or a manifest file with one path per line")
+    parser.add_argument("--output", required=True, help="JSONL file to append results to")
+    parser.add_argument("--batch-size", type=int, default=8, help="Images per model call")
+    parser.add_argument("--decode-workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--max-pixels", type=int, default=DEFAULT_MAX_PIXELS,
+                        help="Skip (as an error) images with more pixels than this")
+    parser.add_argument("--recipes", action="store_true", help="Also generate a recipe per image (much slower)")
+    parser.add_argument("--retry-errors", action="store_true", help="Reprocess images that failed in an earlier run")
+    parser.add_argument("--report-every", type=float, default=10.0, help="Seconds between progress reports")
+    args = parser.parse_args()
+    configure_logging()
+
+    paths = list_images(args.source)
+    done = completed_paths(args.output, args.retry_errors)
+    todo = [path for path in paths if path not in done]
+    logger.info("%d images found, %d already processed, %d to go", len(paths), len(paths) - len(todo), len(todo))
+    if not todo:
+        return
+
+    # Start the decode workers before the models load, so forked workers
+    # do not inherit the model weights.
+    decode_pool = ProcessPoolExecutor(max_workers=args.decode_workers)
+    decode_pool.submit(int).result()  # Workers are started on the first submit
+    caption_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="caption")
+    food_vision.registry.get("caption")
+    food_vision.registry.get("detection")
+
+    processed = failed = 0
+    start = last_report = time.perf_counter()
+    try:
+        with open(args.output, "a", encoding="utf-8") as out:
+            prefetch = args.batch_size * 2
+            for batch in decoded_batches(decode_pool, todo, args.batch_size, args.max_pixels, prefetch):
+                for record in process_batch(batch, caption_pool, args.recipes):
+                    out.write(json.dumps(record) + "\n")
+                    processed += 1
+                    failed += "error" in record
+                # Flushed per batch, so an interruption loses at most one batch
+                out.flush()
+
+                now = time.perf_counter()
+                if now - last_report >= args.report_every:
+                    last_report = now
+                    rate = processed / (now - start)
+                    eta = (len(todo) - processed) / rate if rate else float("inf")
+                    logger.info("%d/%d images, %.2f images/s, %d errors, ETA %.0fs",
+                                processed, len(todo), rate, failed, eta)
+    except KeyboardInterrupt:
+        logger.info("Interrupted; rerun the same command to resume")
+    finally:
+        decode_pool.shutdown(cancel_futures=True)
+        caption_pool.shutdown()
+
+    elapsed = time.perf_counter() - start
+    logger.info("Processed %d images (%d errors) in %.1fs, %.2f images/s",
+                processed, failed, elapsed, processed / elapsed if elapsed else 0.0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+
+class SyntheticSource:
+    """Stand-in for a camera that produces generated frames at a fixed rate.
+
+    Frames are a colour gradient with a moving square, so consecutive frames
+    differ. Implements the subset of the cv2.VideoCapture interface the
+    capture service uses.
+    """
+
+    def __init__(self, width: int = 640, height: int = 480, fps: float = 30.0):
+        self.width = width
+        self.height = height
+        self.interval = 1.0 / fps
+        self._index = 0
+        self._next_frame_at = time.monotonic()
+        x = np.linspace(0, 255, width, dtype=np.uint8)
+        y = np.linspace(0, 255, height, dtype=np.uint8)
+        self._background = np.dstack([
+            np.tile(x, (height, 1)),
+            np.tile(y[:, None], (1, width)),
+            np.full((height, width), 128, dtype=np.uint8),
+        ])
+
+    def isOpened(self) -> bool:
+        return True
+
+    def read(self):
+        delay = self._next_frame_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self._next_frame_at = max(self._next_frame_at + self.interval, time.monotonic())
+
+        frame = self._background.copy()
+        size = min(self.width, self.height) // 4
+        left = (self._index * 8) % max(1, self.width - size)
+        top = (self._index * 4) % max(1, self.height - size)
+        frame[top:top + size, left:left + size] = (0, 0, 255)
+        self._index += 1
+        return True, frame
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return 1.0 / self.interval
+        return 0.0
+
+    def set(self, prop, value) -> bool:
+        return False
+
+    def release(self):
+        pass
+
+
+def open_source(source):
+    """Open a camera index, a video file path, or ``"synthetic"``."""
+    if source == "synthetic":
+        return SyntheticSource()
+    if isinstance(source, str) and source.isdigit():
+        source = int(source)
+    return cv2.VideoCapture(source)
+
+
+class CameraService:
+    """Owns the capture device on a long-lived thread.
+
+    The device is opened once and read continuously; the latest
+    ``buffer_size`` frames are kept in a ring buffer so callers get the
+    freshest frame immediately instead of paying for a device open. The first
+    ``warmup_frames`` frames are discarded while auto-exposure settles. Video
+    files are looped and paced at their native frame rate, which makes them a
+    drop-in replacement for a camera in tests.
+
+    Failed reads back off exponentially (up to ``MAX_BACKOFF_S``). A file
+    that fails ``max_file_failures`` reads in a row, rewinds included, is
+    given up on with ``error`` set; live devices keep retrying.
+    """
+
+    MAX_BACKOFF_S = 1.0
+
+    def __init__(self, source=0, buffer_size: int = 4, warmup_frames: int = 5, opener=open_source,
+                 max_file_failures: int = 5):
+        self.source = source
+        self.max_file_failures = max_file_failures
+        self.warmup_frames = warmup_frames
+        self._opener = opener
+        self._frames = deque(maxlen=buffer_size)  # (captured_at, frame)
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.error = None
+        self.frames_captured = 0
+        self.read_failures = 0
+        self.started_at = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        with self._condition:
+            if self.running:
+                return
+            self._stop_event.clear()
+            self._frames.clear()
+            self.error = None
+            self.started_at = time.time()
+            self._thread = threading.Thread(target=self._capture_loop, name="camera-capture", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 2.0):
+        self._stop_event.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        with self._condition:
+            self._frames.clear()
+            self._condition.notify_all()
+
+    def _is_file_source(self) -> bool:
+        return isinstance(self.source, str) and not self.source.isdigit() and self.source != "synthetic"
+
+    def _capture_loop(self):
+        cap = self._opener(self.source)
+        try:
+            if not cap.isOpened():
+                self.error = f"Could not open camera source {self.source!r}"
+                return
+
+            is_file = self._is_file_source()
+            fps = cap.get(cv2.CAP_PROP_FPS) if is_file else 0
+            frame_interval = 1.0 / fps if fps and fps > 0 else 0
+            skipped = 0
+            failures = 0
+
+            while not self._stop_event.is_set():
+                read_started = time.monotonic()
+                ret, frame = cap.read()
+                if not ret:
+                    failures += 1
+                    if is_file:
+                        if failures >= self.max_file_failures:
+                            self.error = f"Could not read from {self.source!r} ({failures} failed reads)"
+                            return
+                        # Loop the file so it behaves like a live source;
+                        # a single failure is just its end
+                        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                        if failures == 1:
+                            continue
+                    self.read_failures += 1
+                    self._stop_event.wait(min(0.05 * 2 ** (failures - 1), self.MAX_BACKOFF_S))
+                    continue
+                failures = 0
+
+                if skipped < self.warmup_frames:
+                    skipped += 1
+                    continue
+
+                with self._condition:
+                    self._frames.append((time.time(), frame))
+                    self.frames_captured += 1
+                    self._condition.notify_all()
+
+                if frame_interval:
+                    remaining = frame_interval - (time.monotonic() - read_started)
+                    if remaining > 0:
+                        self._stop_event.wait(remaining)
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            cap.release()
+            with self._condition:
+                self._condition.notify_all()
+
+    def latest(self, timeout: float = 5.0):
+        """Return ``(frame, captured_at)`` for the newest frame.
+
+        Waits up to ``timeout`` seconds for the first frame after a start.
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while not self._frames:
+                remaining = deadline - time.monotonic()
+                if self.error or not self.running or remaining <= 0:
+                    raise RuntimeError(self.error or "No frame available from camera")
+                self._condition.wait(remaining)
+            captured_at, frame = self._frames[-1]
+            return frame, captured_at
+
+    def recent_frames(self) -> list:
+        """Snapshot of the ring buffer, oldest first."""
+        with self._condition:
+            return [frame for _, frame in self._frames]
+
+    def frame_age(self):
+        """Seconds since the newest buffered frame was captured, or None."""
+        with self._condition:
+            if not self._frames:
+                return None
+            return time.time() - self._frames[-1][0]
+
+    def status(self) -> dict:
+        age = self.frame_age()
+        return {
+            "running": self.running,
+            "source": str(self.source),
+            "buffered_frames": len(self._frames),
+            "frames_captured": self.frames_captured,
+            "read_failures": self.read_failures,
+            "frame_age_ms": round(age * 1000, 1) if age is not None else None,
+            "error": self.error,
+        }
+
+
+class SceneChangeDetector:
+    """Cheap test for whether a frame differs enough from the last analyzed one.
+
+    Frames are shrunk to a small grayscale thumbnail and compared by mean
+    absolute pixel difference (0 = identical, 1 = inverted), which costs a
+    fraction of a millisecond and ignores sensor noise and tiny movements.
+    """
+
+    def __init__(self, threshold: float = 0.06, size: tuple = (64, 48)):
+        self.threshold = threshold
+        self.size = size
+        self._reference = None
+
+    def _thumbnail(self, frame: np.ndarray) -> np.ndarray:
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        return cv2.resize(gray, self.size, interpolation=cv2.INTER_AREA).astype(np.float32) / 255.0
+
+    def difference(self, frame: np.ndarray) -> float:
+        if self._reference is None:
+            return 1.0
+        return float(np.abs(self._thumbnail(frame) - self._reference).mean())
+
+    def changed(self, frame: np.ndarray) -> bool:
+        return self.difference(frame) >= self.threshold
+
+    def mark(self, frame: np.ndarray):
+        """Make ``frame`` the reference that later frames are compared to."""
+        self._reference = self._thumbnail(frame)
+
+    def reset(self):
+        self._reference = None
+
+
+class LiveAnalyzer:
+    """Runs ``analyze_fn(frame)`` on a background thread for a live video feed.
+
+    ``offer`` is called with every displayed frame and returns immediately.
+    A frame is analyzed only if the worker is idle and the scene has changed
+    since the last analyzed frame; otherwise it is skipped, so a static
+    scene costs no inference at all. ``refresh_s`` (0 = never) re-analyzes a
+    static scene after that long.
+    """
+
+    def __init__(self, analyze_fn, detector: SceneChangeDetector = None, refresh_s: float = 0.0):
+        self.analyze_fn = analyze_fn
+        self.detector = detector or SceneChangeDetector()
+        self.refresh_s = refresh_s
+        self._lock = threading.Lock()
+        self._pending = None
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._busy = False
+        self._thread = None
+        self._last_started = 0.0
+        self.result = None
+        self.counters = {"offered": 0, "analyzed": 0, "skipped_busy": 0, "skipped_static": 0, "errors": 0}
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="live-analyzer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop_event.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def offer(self, frame: np.ndarray) -> bool:
+        """Hand a frame to the worker if it is idle and the scene changed."""
+        self.counters["offered"] += 1
+        with self._lock:
+            if self._busy:
+                self.counters["skipped_busy"] += 1
+                return False
+            stale = self.refresh_s and time.monotonic() - self._last_started >= self.refresh_s
+            if not stale and not self.detector.changed(frame):
+                self.counters["skipped_static"] += 1
+                return False
+            self.detector.mark(frame)
+            self._busy = True
+            self._pending = frame.copy()
+            self._last_started = time.monotonic()
+        self._wake.set()
+        return True
+
+    @property
+    def busy(self) -> bool:
+        return self._busy
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._wake.wait()
+            self._wake.clear()
+            with self._lock:
+                frame, self._pending = self._pending, None
+            if frame is None:
+                continue
+            started = time.perf_counter()
+            try:
+                result = self.analyze_fn(frame)
+                self.result = dict(result, analyzed_at=time.time(), latency_s=time.perf_counter() - started)
+                self.counters["analyzed"] += 1
+            except Exception as e:
+                self.result = {"error": str(e), "analyzed_at": time.time()}
+                self.counters["errors"] += 1
+            finally:
+                with self._lock:
+                    self._busy = False
+
+
+def draw_overlay(frame: np.ndarray, result: dict, busy: bool = False) -> np.ndarray:
+    """Draw the latest analysis result onto a BGR frame in place."""
+    lines = []
+    if result is None:
+        lines.append("Analyzing..." if busy else "Waiting for a scene change...")
+    elif "error" in result:
+        lines.append(f"Error: {result['error']}")
+    else:
+        lines.append(result.get("caption", ""))
+        ingredients = result.get("ingredients") or []
+        if ingredients:
+            lines.append("Ingredients: " + ", ".join(ingredients[:8]))
+        status = f"{result['latency_s'] * 1000:.0f} ms"
+        lines.append(status + (" (updating)" if busy else ""))
+
+    line_height = 22
+    cv2.rectangle(frame, (0, 0), (frame.shape[1], 10 + line_height * len(lines)), (0, 0, 0), thickness=-1)
+    for i, text in enumerate(lines):
+        cv2.putText(frame, text, (8, 24 + line_height * i), cv2.FONT_HERSHEY_SIMPLEX, 0.55,
+                    (255, 255, 255), 1, cv2.LINE_AA)
+    return frame
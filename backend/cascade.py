@@ -0,0 +1,149 @@
+"""Latency-budget cascade over the caption/detect/recipe pipeline.
+
+With no budget (the ``full`` tier) every stage runs, caption and detection
+side by side. With a budget, detection runs first because it is the
+cheapest signal, and each later stage runs only if it is needed and the
+remaining budget covers its expected cost:
+
+* caption is skipped when detection already found a confident food label,
+  shortened when only a short caption fits, and skipped when none fits;
+* GPT-2 is skipped in favour of a cached or template recipe when its
+  expected generation time does not fit.
+
+Expected costs are moving averages of what each stage actually took here,
+so the cascade adapts to the host and the precision mode.
+"""
+import os
+import threading
+import time
+
+from food_vision import combine_ingredients, generate_recipe_with_source
+
+# Seconds; None means no budget
+TIERS = {"fast": 1.5, "balanced": 6.0, "full": None}
+DEFAULT_TIER = os.environ.get("DEFAULT_QUALITY_TIER", "full")
+
+# A detection at least this confident makes the caption redundant
+CONFIDENT_DETECTION = float(os.environ.get("CASCADE_CONFIDENT_DETECTION", "0.9"))
+SHORT_CAPTION_TOKENS = int(os.environ.get("CASCADE_SHORT_CAPTION_TOKENS", "20"))
+
+
+class StageCosts:
+    """Exponential moving average of each stage's wall time, in seconds."""
+
+    # Starting guesses for fp32 on a laptop CPU, replaced by measurements
+    DEFAULTS = {"detect": 1.0, "caption": 1.0, "caption_short": 0.5, "recipe_model": 8.0}
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self._costs = dict(self.DEFAULTS)
+        self._lock = threading.Lock()
+
+    def estimate(self, stage: str) -> float:
+        with self._lock:
+            return self._costs[stage]
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            self._costs[stage] = (1 - self.alpha) * self._costs[stage] + self.alpha * seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {stage: round(cost, 3) for stage, cost in self._costs.items()}
+
+
+stage_costs = StageCosts()
+
+
+def resolve_budget(tier: str = None, budget_ms: float = None) -> float:
+    """Budget in seconds (None = unlimited) from an explicit budget or a tier name."""
+    if budget_ms is not None:
+        if budget_ms <= 0:
+            raise ValueError("budget_ms must be positive")
+        return budget_ms / 1000.0
+    tier = (tier or DEFAULT_TIER).lower()
+    if tier not in TIERS:
+        raise ValueError(f"tier must be one of {sorted(TIERS)}, got {tier!r}")
+    return TIERS[tier]
+
+
+class _Report:
+    def __init__(self):
+        self.stages = []
+
+    def ran(self, stage: str, seconds: float, **details):
+        self.stages.append({"stage": stage, "ran": True, "ms": round(seconds * 1000, 1), **details})
+
+    def skipped(self, stage: str, reason: str):
+        self.stages.append({"stage": stage, "ran": False, "reason": reason})
+
+
+def _timed_result(future, started: float) -> tuple:
+    result = future.result()
+    return result, time.perf_counter() - started
+
+
+def run_cascade(pixels, deadline: float, caption_batcher, short_caption_batcher, detection_batcher) -> tuple:
+    """Run the pipeline on decoded ``pixels`` within ``deadline``.
+
+    ``deadline`` is a ``time.perf_counter()`` value, or None for no budget.
+    Returns ``(caption, detection_scores, ingredients, recipe, stages)`` where
+    ``stages`` lists, in order, which stages ran and what each cost, or why
+    it was skipped.
+    """
+    report = _Report()
+
+    def remaining() -> float:
+        return float("inf") if deadline is None else deadline - time.perf_counter()
+
+    if deadline is None:
+        # Full quality: both models side by side, as before
+        started = time.perf_counter()
+        caption_future = caption_batcher.submit((pixels, None))
+        detection_future = detection_batcher.submit(pixels)
+        detection_scores, detect_s = _timed_result(detection_future, started)
+        caption, caption_s = _timed_result(caption_future, started)
+        stage_costs.record("detect", detect_s)
+        stage_costs.record("caption", caption_s)
+        report.ran("detect", detect_s)
+        report.ran("caption", caption_s)
+    else:
+        started = time.perf_counter()
+        detection_scores, detect_s = _timed_result(detection_batcher.submit(pixels), started)
+        stage_costs.record("detect", detect_s)
+        report.ran("detect", detect_s)
+
+        best = max(detection_scores.values(), default=0.0)
+        caption = ""
+        if best >= CONFIDENT_DETECTION:
+            report.skipped("caption", f"confident detection ({best:.2f})")
+        elif remaining() >= stage_costs.estimate("caption"):
+            started = time.perf_counter()
+            caption, caption_s = _timed_result(caption_batcher.submit((pixels, deadline)), started)
+            stage_costs.record("caption", caption_s)
+            report.ran("caption", caption_s)
+        elif remaining() >= stage_costs.estimate("caption_short"):
+            started = time.perf_counter()
+            caption, caption_s = _timed_result(short_caption_batcher.submit((pixels, deadline)), started)
+            stage_costs.record("caption_short", caption_s)
+            report.ran("caption", caption_s, max_tokens=SHORT_CAPTION_TOKENS)
+        else:
+            report.skipped("caption", "over budget")
+        if not caption and detection_scores:
+            caption = "Detected: " + ", ".join(detection_scores)
+
+    ingredients = combine_ingredients(caption, list(detection_scores))
+
+    use_model = remaining() >= stage_costs.estimate("recipe_model")
+    started = time.perf_counter()
+    recipe, source = generate_recipe_with_source(ingredients, use_model=use_model, deadline=deadline)
+    recipe_s = time.perf_counter() - started
+    if source in ("model", "template") and use_model:
+        # A model attempt, even one that fell back to the template
+        stage_costs.record("recipe_model", recipe_s)
+    details = {"source": source}
+    if not use_model and source == "template":
+        details["reason"] = "model over budget"
+    report.ran("recipe", recipe_s, **details)
+
+    return caption, detection_scores, ingredients, recipe, report.stages
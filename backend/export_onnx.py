@@ -0,0 +1,188 @@
+"""Export the caption and detection models to ONNX for the ONNX Runtime backend.
+
+Builds the graphs from locally cached Hugging Face weights (no network
+access), then lets ONNX Runtime apply its offline graph optimizations.
+The caption decoder is exported as a single decoding step that takes and
+returns the self-attention key/value cache, so greedy decoding costs one
+token's work per step instead of re-running the whole prefix:
+
+    python export_onnx.py --output onnx_models
+    INFERENCE_BACKEND=onnx ONNX_MODEL_DIR=onnx_models python app.py
+
+Needs ``pip install onnx onnxruntime``.
+"""
+import argparse
+import json
+import os
+
+import onnxruntime as ort
+import torch
+from transformers import (
+    VisionEncoderDecoderModel, ViTImageProcessor, AutoTokenizer,
+    DetrForObjectDetection, DetrImageProcessor,
+)
+
+from food_vision import CAPTION_MODEL_NAME, DETECTION_MODEL_NAME
+
+OPSET_VERSION = 17
+
+
+class _CaptionEncoder(torch.nn.Module):
+    def __init__(self, model: VisionEncoderDecoderModel):
+        super().__init__()
+        self.encoder = model.encoder
+        # Only present when encoder and decoder hidden sizes differ
+        self.enc_to_dec_proj = getattr(model, "enc_to_dec_proj", None)
+
+    def forward(self, pixel_values):
+        hidden = self.encoder(pixel_values=pixel_values).last_hidden_state
+        if self.enc_to_dec_proj is not None:
+            hidden = self.enc_to_dec_proj(hidden)
+        return hidden
+
+
+class _CaptionDecoderWithPast(torch.nn.Module):
+    """One decoding step: new tokens plus the cached self-attention keys/values.
+
+    ``past`` is flattened as key_0, value_0, key_1, ... and may have length 0
+    along the sequence axis for the first step.
+    """
+
+    def __init__(self, model: VisionEncoderDecoderModel):
+        super().__init__()
+        self.decoder = model.decoder
+
+    def forward(self, input_ids, encoder_hidden_states, *past):
+        past_key_values = tuple((past[i], past[i + 1]) for i in range(0, len(past), 2))
+        outputs = self.decoder(input_ids=input_ids, encoder_hidden_states=encoder_hidden_states,
+                               past_key_values=past_key_values, use_cache=True)
+        present = outputs.past_key_values
+        if hasattr(present, "to_legacy_cache"):
+            present = present.to_legacy_cache()
+        # Self-attention only; cross-attention keys/values come from
+        # encoder_hidden_states on every step
+        return (outputs.logits, *(t for layer in present for t in layer[:2]))
+
+
+def _past_names(num_layers: int, prefix: str = "past") -> list:
+    return [f"{prefix}_{kind}_{i}" for i in range(num_layers) for kind in ("key", "value")]
+
+
+class _Detector(torch.nn.Module):
+    def __init__(self, model: DetrForObjectDetection):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values, pixel_mask):
+        # Only the class logits are used downstream, so the box head is not exported
+        return self.model(pixel_values=pixel_values, pixel_mask=pixel_mask).logits
+
+
+def _optimize(path: str):
+    """Rewrite ``path`` with ONNX Runtime's offline graph optimizations applied."""
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+    optimized_path = f"{path}.optimized"
+    options.optimized_model_filepath = optimized_path
+    ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+    os.replace(optimized_path, path)
+
+
+def export_caption(output_dir: str) -> dict:
+    caption_dir = os.path.join(output_dir, "caption")
+    os.makedirs(caption_dir, exist_ok=True)
+    model = VisionEncoderDecoderModel.from_pretrained(CAPTION_MODEL_NAME, local_files_only=True).eval()
+    processor = ViTImageProcessor.from_pretrained(CAPTION_MODEL_NAME, local_files_only=True)
+    tokenizer = AutoTokenizer.from_pretrained(CAPTION_MODEL_NAME, local_files_only=True, use_fast=True)
+
+    decoder_start = model.config.decoder_start_token_id
+    if decoder_start is None:
+        decoder_start = tokenizer.bos_token_id
+    eos = model.config.eos_token_id if model.config.eos_token_id is not None else tokenizer.eos_token_id
+    pad = model.config.pad_token_id if model.config.pad_token_id is not None else eos
+
+    size = processor.size
+    height, width = (size["height"], size["width"]) if isinstance(size, dict) else (size, size)
+    pixel_values = torch.zeros(1, 3, height, width)
+    with torch.inference_mode():
+        hidden = _CaptionEncoder(model)(pixel_values)
+
+    print("Exporting caption encoder...")
+    encoder_path = os.path.join(caption_dir, "encoder.onnx")
+    torch.onnx.export(
+        _CaptionEncoder(model), (pixel_values,), encoder_path,
+        input_names=["pixel_values"], output_names=["encoder_hidden_states"],
+        dynamic_axes={"pixel_values": {0: "batch"}, "encoder_hidden_states": {0: "batch"}},
+        opset_version=OPSET_VERSION, do_constant_folding=True,
+    )
+
+    print("Exporting caption decoder (with past)...")
+    decoder_path = os.path.join(caption_dir, "decoder_with_past.onnx")
+    decoder_config = model.decoder.config
+    num_layers, num_heads = decoder_config.n_layer, decoder_config.n_head
+    head_dim = decoder_config.n_embd // num_heads
+    input_ids = torch.full((1, 1), decoder_start, dtype=torch.long)
+    past = [torch.zeros(1, num_heads, 1, head_dim) for _ in range(2 * num_layers)]
+    inputs, presents = _past_names(num_layers), _past_names(num_layers, "present")
+    dynamic_axes = {
+        "input_ids": {0: "batch", 1: "sequence"},
+        "encoder_hidden_states": {0: "batch"},
+        "logits": {0: "batch", 1: "sequence"},
+    }
+    dynamic_axes.update({name: {0: "batch", 2: "past_sequence"} for name in inputs})
+    dynamic_axes.update({name: {0: "batch", 2: "total_sequence"} for name in presents})
+    torch.onnx.export(
+        _CaptionDecoderWithPast(model), (input_ids, hidden, *past), decoder_path,
+        input_names=["input_ids", "encoder_hidden_states", *inputs], output_names=["logits", *presents],
+        dynamic_axes=dynamic_axes, opset_version=OPSET_VERSION, do_constant_folding=True,
+    )
+
+    for path in (encoder_path, decoder_path):
+        _optimize(path)
+    processor.save_pretrained(caption_dir)
+    tokenizer.save_pretrained(caption_dir)
+    return {
+        "decoder_start_token_id": decoder_start, "eos_token_id": eos, "pad_token_id": pad,
+        "num_layers": num_layers, "num_heads": num_heads, "head_dim": head_dim,
+    }
+
+
+def export_detection(output_dir: str) -> dict:
+    detection_dir = os.path.join(output_dir, "detection")
+    os.makedirs(detection_dir, exist_ok=True)
+    model = DetrForObjectDetection.from_pretrained(DETECTION_MODEL_NAME, local_files_only=True).eval()
+    processor = DetrImageProcessor.from_pretrained(DETECTION_MODEL_NAME, local_files_only=True)
+
+    print("Exporting detection model...")
+    detr_path = os.path.join(detection_dir, "detr.onnx")
+    pixel_values = torch.zeros(1, 3, 800, 1066)
+    pixel_mask = torch.ones(1, 800, 1066, dtype=torch.long)
+    torch.onnx.export(
+        _Detector(model), (pixel_values, pixel_mask), detr_path,
+        input_names=["pixel_values", "pixel_mask"], output_names=["logits"],
+        dynamic_axes={
+            "pixel_values": {0: "batch", 2: "height", 3: "width"},
+            "pixel_mask": {0: "batch", 1: "height", 2: "width"},
+            "logits": {0: "batch"},
+        },
+        opset_version=OPSET_VERSION, do_constant_folding=True,
+    )
+    _optimize(detr_path)
+    processor.save_pretrained(detection_dir)
+    return {"num_labels": model.config.num_labels, "id2label": {str(k): v for k, v in model.config.id2label.items()}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default="onnx_models", help="Directory to write the ONNX models to")
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    config = {"caption": export_caption(args.output), "detection": export_detection(args.output)}
+    with open(os.path.join(args.output, "onnx_config.json"), "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+    print(f"ONNX models written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
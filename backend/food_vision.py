@@ -1,212 +1,499 @@
 import cv2
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from PIL import Image
-import torch
-from transformers import (
-    VisionEncoderDecoderModel, ViTImageProcessor, AutoTokenizer,
-    DetrForObjectDetection, DetrImageProcessor,
-    AutoModelForCausalLM, AutoTokenizer as CausalTokenizer,
-)
 import random
 
+import metrics
+from batching import MicroBatcher
+from generation import DeadlineTracker, deadline_after, trim_to_boundary
+from camera import LiveAnalyzer, SceneChangeDetector, draw_overlay, open_source
+from model_registry import ModelRegistry
+from recipe_cache import RecipeCache
+from vocabulary import CAPTION_STOP_WORDS, RECIPE_STOP_WORDS, caption_matcher
+
+logger = logging.getLogger(__name__)
+
 # --- Load Models ---
-print("Loading models...")
-
-# Image Captioning
-print("Loading image captioning model...")
-caption_model = VisionEncoderDecoderModel.from_pretrained("nlpconnect/vit-gpt2-image-captioning")
-caption_processor = ViTImageProcessor.from_pretrained("nlpconnect/vit-gpt2-image-captioning")
-caption_tokenizer = AutoTokenizer.from_pretrained("nlpconnect/vit-gpt2-image-captioning")
-
-# Object Detection
-print("Loading object detection model...")
-det_model = DetrForObjectDetection.from_pretrained("facebook/detr-resnet-50")
-det_processor = DetrImageProcessor.from_pretrained("facebook/detr-resnet-50")
-
-# Recipe Generation - Using a smaller model instead of Mistral-7B
-print("Loading recipe generation model...")
-try:
-    # Try to use a smaller language model for recipe generation
-    recipe_model = AutoModelForCausalLM.from_pretrained("gpt2")
-    recipe_tokenizer = CausalTokenizer.from_pretrained("gpt2")
-    use_real_recipe_model = True
-except Exception as e:
-    print(f"Could not load recipe model: {e}")
-    print("Using fallback recipe generation")
-    use_real_recipe_model = False
-    
-    # Define some food-related keywords for recipe generation
-    FOOD_KEYWORDS = ["potato", "tomato", "onion", "garlic", "chicken", "beef", "carrot", 
-                    "broccoli", "spinach", "rice", "pasta", "cheese", "egg", "mushroom",
-                    "bell pepper", "olive oil", "salt", "pepper", "basil", "oregano"]
-
-print("Models loaded successfully.")
+# Models are loaded lazily through the registry: on first use, or ahead of
+# time by calling registry.warm_up(). Importing this module stays cheap.
+CAPTION_MODEL_NAME = "nlpconnect/vit-gpt2-image-captioning"
+DETECTION_MODEL_NAME = "facebook/detr-resnet-50"
+RECIPE_MODEL_NAME = "gpt2"
+
+# torch (default) or onnx. Torch and transformers are only imported by the
+# loaders that need them, so the ONNX backend keeps torch out of the process
+# (set RECIPE_MODEL=none as well to skip GPT-2).
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "torch").lower()
+ONNX_MODEL_DIR = os.environ.get("ONNX_MODEL_DIR", "onnx_models")
+RECIPE_MODEL_NAME = os.environ.get("RECIPE_MODEL", RECIPE_MODEL_NAME)
+
+# fp32, int8 (dynamic quantization) or bf16 (autocast), chosen at startup.
+# Applies to the torch models only.
+PRECISION_MODE = os.environ.get("INFERENCE_PRECISION", "fp32").lower()
+# inference.PRECISION_MODES, repeated here since that module imports torch
+SUPPORTED_PRECISION_MODES = ("fp32", "int8", "bf16")
+if PRECISION_MODE not in SUPPORTED_PRECISION_MODES:
+    # Fail at startup rather than when the first model loads
+    raise ValueError(f"INFERENCE_PRECISION must be one of {SUPPORTED_PRECISION_MODES}, got {PRECISION_MODE!r}")
+
+registry = ModelRegistry()
+
+def _load_caption_model(precision: str = None):
+    if INFERENCE_BACKEND == "onnx":
+        from onnx_backend import OnnxCaptioner
+        return OnnxCaptioner(ONNX_MODEL_DIR)
+    from torch_backend import TorchCaptioner
+    return TorchCaptioner.from_pretrained(CAPTION_MODEL_NAME, precision or PRECISION_MODE)
+
+def _load_detection_model(precision: str = None):
+    if INFERENCE_BACKEND == "onnx":
+        from onnx_backend import OnnxDetector
+        return OnnxDetector(ONNX_MODEL_DIR)
+    from torch_backend import TorchDetector
+    return TorchDetector.from_pretrained(DETECTION_MODEL_NAME, precision or PRECISION_MODE)
+
+def _recipe_preamble() -> str:
+    # Optional few-shot examples placed before every prompt; cached with the prefix
+    path = os.environ.get("RECIPE_PREAMBLE_FILE")
+    if not path:
+        return ""
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+def _load_recipe_model(precision: str = None):
+    # Recipe Generation - Using a smaller model instead of Mistral-7B
+    if RECIPE_MODEL_NAME.lower() == "none":
+        raise RuntimeError("Recipe model disabled by RECIPE_MODEL=none")
+    from transformers import AutoModelForCausalLM, AutoTokenizer as CausalTokenizer
+    from inference import prepare_model
+    from recipe_generator import RecipeGenerator
+    recipe_model = AutoModelForCausalLM.from_pretrained(RECIPE_MODEL_NAME)
+    recipe_model = prepare_model(recipe_model, precision or PRECISION_MODE)
+    recipe_tokenizer = CausalTokenizer.from_pretrained(RECIPE_MODEL_NAME)
+    return RecipeGenerator(recipe_model, recipe_tokenizer, _recipe_preamble())
+
+registry.register("caption", _load_caption_model)
+registry.register("detection", _load_detection_model)
+# If GPT-2 cannot be loaded, generate_recipe falls back to templates
+registry.register("recipe", _load_recipe_model, required=False)
+
+# Real recipes retrieved from a local corpus (see recipe_index.py) are used
+# before GPT-2, which then only runs when no recipe matches well enough
+RECIPE_INDEX_DIR = os.environ.get("RECIPE_INDEX_DIR")
+RECIPE_MATCH_MIN_SCORE = float(os.environ.get("RECIPE_MATCH_MIN_SCORE", "0.25"))
+
+def _load_recipe_index(precision: str = None):
+    from recipe_index import RecipeIndex
+    return RecipeIndex(RECIPE_INDEX_DIR)
+
+if RECIPE_INDEX_DIR:
+    registry.register("recipe_index", _load_recipe_index, required=False)
+
+# Recipes are cached by normalized ingredient set; several variants per set
+# keep repeat dishes from all getting the identical answer.
+recipe_cache = RecipeCache(
+    max_entries=int(os.environ.get("RECIPE_CACHE_SIZE", "1024")),
+    ttl_seconds=float(os.environ.get("RECIPE_CACHE_TTL", "3600")),
+    variants_per_key=int(os.environ.get("RECIPE_CACHE_VARIANTS", "3")),
+)
+
+# Detection post-processing settings
+DETECTION_THRESHOLD = float(os.environ.get("DETECTION_THRESHOLD", "0.3"))  # Lower threshold to detect more objects
+DETECTION_TOP_K = int(os.environ.get("DETECTION_TOP_K", "10"))
+
+# Generation bounds. Token budgets count new tokens only (the caption default
+# matches the old max_length=64, which included the start token); the
+# deadlines cap wall time per generate call, returning partial output.
+CAPTION_MAX_NEW_TOKENS = int(os.environ.get("CAPTION_MAX_NEW_TOKENS", "63"))
+CAPTION_DEADLINE_S = float(os.environ.get("CAPTION_DEADLINE_S", "5"))
+RECIPE_MAX_NEW_TOKENS = int(os.environ.get("RECIPE_MAX_NEW_TOKENS", "280"))
+RECIPE_DEADLINE_S = float(os.environ.get("RECIPE_DEADLINE_S", "20"))
 
 # --- Helper Functions ---
+def prepare_image(image: Image.Image) -> np.ndarray:
+    """Decode an image and convert it to RGB once, for both models.
+
+    Returns an RGB uint8 array (H, W, 3) that both processors accept directly,
+    so neither of them converts or copies the PIL image again. Only this
+    decode and mode conversion is shared: the ViT and DETR processors still
+    resize, rescale and normalize separately, since they need different
+    sizes and normalization constants.
+    """
+    if isinstance(image, np.ndarray):
+        return image
+    return np.asarray(image.convert("RGB"))
+
+def get_captions(images: list, max_new_tokens: int = CAPTION_MAX_NEW_TOKENS, deadline: float = None) -> list:
+    """Caption a batch of images with a single generate call.
+
+    Generation stops after CAPTION_DEADLINE_S or at ``deadline``
+    (``time.perf_counter()``), whichever comes first.
+    """
+    captioner = registry.get("caption")
+    with metrics.STAGE_SECONDS.time(stage="caption"):
+        return captioner.caption(
+            images, max_new_tokens=max_new_tokens, deadline=deadline_after(CAPTION_DEADLINE_S, deadline))
+
+def caption_requests(requests: list, max_new_tokens: int = CAPTION_MAX_NEW_TOKENS) -> list:
+    """Batch function for the caption batchers: ``(pixels, deadline)`` pairs.
+
+    The batch shares one generate call, so it stops at the earliest request
+    deadline; requests without a budget pass None.
+    """
+    deadlines = [deadline for _, deadline in requests if deadline is not None]
+    return get_captions([pixels for pixels, _ in requests], max_new_tokens=max_new_tokens,
+                        deadline=min(deadlines, default=None))
+
 def get_caption(image: Image.Image) -> str:
-    inputs = caption_processor(images=image, return_tensors="pt").pixel_values
-    outputs = caption_model.generate(inputs, max_length=64)
-    return caption_tokenizer.decode(outputs[0], skip_special_tokens=True)
+    return get_captions([image])[0]
+
+def detect_food_batch(images: list) -> list:
+    """Run DETR over a batch of images in one forward pass.
+
+    Returns one ``{label: score}`` dict per image, holding the food labels
+    found, highest score first.
+    """
+    detector = registry.get("detection")
+    with metrics.STAGE_SECONDS.time(stage="detect"):
+        batch_items = detector.detect(images, DETECTION_THRESHOLD, DETECTION_TOP_K)
+    for detected in batch_items:
+        # If no food items detected, try to extract potential food items from the caption
+        if not detected:
+            logger.debug("No food items detected directly, will rely on caption analysis")
+    return batch_items
+
+def detect_ingredients_batch(images: list) -> list:
+    """Like detect_food_batch, but only the labels for each image."""
+    return [list(detected) for detected in detect_food_batch(images)]
 
 def get_detected_ingredients(image: Image.Image) -> list:
-    # Lower the detection threshold to catch more potential food items
-    threshold = 0.3  # Lower threshold to detect more objects
-    
-    inputs = det_processor(images=image, return_tensors="pt")
-    outputs = det_model(**inputs)
-    target_sizes = torch.tensor([image.size[::-1]])
-    results = det_processor.post_process_object_detection(outputs, threshold=threshold, target_sizes=target_sizes)[0]
-    
-    # Get labels and scores
-    labels = []
-    scores = []
-    for i, (label_id, score) in enumerate(zip(results["labels"], results["scores"])):
-        label = det_model.config.id2label[label_id.item()]
-        score_val = score.item()
-        print(f"Detected: {label} with confidence {score_val:.2f}")
-        labels.append(label)
-        scores.append(score_val)
-    
-    # Filter for food items or common objects that could be food
-    food_related = [
-        "banana", "apple", "sandwich", "orange", "broccoli", "carrot", "hot dog", "pizza", 
-        "donut", "cake", "bowl", "cup", "fork", "knife", "spoon", "food", "fruit", "vegetable",
-        "potato", "tomato", "onion", "garlic", "pepper", "rice", "pasta", "bread", "cheese",
-        "meat", "chicken", "beef", "pork", "fish", "egg", "milk", "butter", "oil", "salt",
-        "bottle", "plate", "dining table"
-    ]
+    return detect_ingredients_batch([image])[0]
+
+def combine_ingredients(caption: str, detected_objects: list) -> list:
+    # Extract potential food items from caption in a single pass
+    caption_ingredients = caption_matcher.match_words(caption)
     
-    # Add any detected items that might be food-related
-    detected_items = []
-    for label in labels:
-        # Check if the label is food-related or contains food-related keywords
-        label_lower = label.lower()
-        if any(food in label_lower for food in food_related) or label_lower in food_related:
-            detected_items.append(label)
+    # Combine detected objects with caption words for ingredients
+    all_ingredients = detected_objects + caption_ingredients
     
-    # If no food items detected, try to extract potential food items from the caption
-    if not detected_items:
-        print("No food items detected directly, will rely on caption analysis")
+    # Clean up ingredients - remove duplicates and non-food items
+    ingredients = []
+    for item in all_ingredients:
+        if len(item) > 2 and item.lower() not in CAPTION_STOP_WORDS:
+            ingredients.append(item)
+    
+    # Remove duplicates
+    ingredients = list(set(ingredients))
+    
+    # If no ingredients detected, add some default ones based on the image type
+    if not ingredients:
+        logger.debug("No ingredients detected, adding defaults based on caption")
+        if "potato" in caption.lower():
+            ingredients = ["potato", "butter", "salt", "pepper", "garlic"]
+        else:
+            ingredients = ["vegetable", "salt", "pepper", "olive oil"]
     
-    return list(set(detected_items))
+    return ingredients
 
-def generate_recipe(ingredients: list) -> str:
-    print(f"Generating recipe for ingredients: {ingredients}")
+_pipeline_pool = None
+_pipeline_pool_pid = None
+
+def _get_pipeline_pool() -> ThreadPoolExecutor:
+    # Created lazily, and again in a forked child, since threads do not survive fork
+    global _pipeline_pool, _pipeline_pool_pid
+    if _pipeline_pool is None or _pipeline_pool_pid != os.getpid():
+        _pipeline_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="pipeline")
+        _pipeline_pool_pid = os.getpid()
+    return _pipeline_pool
+
+def analyze_image(image: Image.Image) -> tuple:
+    """Caption and detect on one image concurrently.
+
+    The image is preprocessed once and the two models run side by side; torch
+    releases the GIL during the forward passes, so latency is roughly that of
+    the slower model rather than the sum of both.
+    """
+    pixels = prepare_image(image)
+    caption_future = _get_pipeline_pool().submit(get_caption, pixels)
+    detected = get_detected_ingredients(pixels)
+    return caption_future.result(), detected
+
+def filter_recipe_ingredients(ingredients: list) -> list:
     # Filter out non-food items from ingredients
-    food_items = []
-    for item in ingredients:
-        item_lower = item.lower()
-        if item_lower not in ['person', 'people', 'man', 'woman', 'child', 'boy', 'girl', 'a', 'the', 'and', 'with', 'of', 'in', 'on']:
-            food_items.append(item)
+    return [item for item in ingredients if item.lower() not in RECIPE_STOP_WORDS]
+
+def _generate_recipe_batch(items: list) -> list:
+    # items: (food_items, DeadlineTracker) pairs from concurrent requests,
+    # decoded together in one padded batch
+    generator = registry.get("recipe")
+    return generator.generate([food_items for food_items, _ in items], RECIPE_MAX_NEW_TOKENS,
+                              [tracker for _, tracker in items])
+
+# Concurrent recipe requests share GPT-2 forward passes
+recipe_batcher = MicroBatcher(
+    _generate_recipe_batch,
+    max_batch_size=int(os.environ.get("RECIPE_BATCH_MAX_SIZE", "4")),
+    max_wait_ms=float(os.environ.get("RECIPE_BATCH_WAIT_MS", "20")),
+    name="recipe",
+)
+
+def search_recipes(ingredients: list, k: int = 5) -> list:
+    """Best-matching corpus recipes for ``ingredients``; [] without an index."""
+    if not RECIPE_INDEX_DIR:
+        return []
+    try:
+        index = registry.get("recipe_index")
+    except Exception:
+        return []  # Load failure already logged by the registry
+    return index.search(filter_recipe_ingredients(ingredients), k)
+
+def _retrieve_recipe(food_items: list):
+    """The best corpus recipe as text, or None if nothing matches well enough."""
+    matches = search_recipes(food_items, k=1)
+    if not matches or matches[0]["score"] < RECIPE_MATCH_MIN_SCORE:
+        return None
+    from recipe_index import format_recipe
+    logger.debug("Retrieved recipe %r (score %.3f)", matches[0]["title"], matches[0]["score"])
+    return format_recipe(matches[0])
+
+def is_complete_recipe(recipe: str) -> bool:
+    # If the recipe is too short or doesn't look like a proper recipe, fall back to template
+    return len(recipe.split('\n')) >= 3 and 'ingredient' in recipe.lower()
+
+def generate_recipe(ingredients: list) -> str:
+    return generate_recipe_with_source(ingredients)[0]
+
+def generate_recipe_with_source(ingredients: list, use_model: bool = True, deadline: float = None) -> tuple:
+    """Returns ``(recipe, source)``; source is "retrieval", "cache", "model", "template" or "none".
+
+    A good enough match from the recipe index wins outright; it is cheap
+    enough to skip the cache. With ``use_model=False`` GPT-2 is not tried: the recipe comes from the
+    cache or straight from a template, and that template is not cached, so
+    later requests with time for the model still get a generated recipe.
+    GPT-2 stops at ``deadline`` (``time.perf_counter()``) or after
+    RECIPE_DEADLINE_S, whichever is first.
+    """
+    logger.debug("Generating recipe for ingredients: %s", ingredients)
+    food_items = filter_recipe_ingredients(ingredients)
     
     if not food_items:
-        return "No food items detected to generate a recipe."
+        return "No food items detected to generate a recipe.", "none"
+    
+    logger.debug("Filtered food items: %s", food_items)
+    
+    start = time.perf_counter()
+    retrieved = _retrieve_recipe(food_items)
+    if retrieved is not None:
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - start, stage="recipe")
+        return retrieved, "retrieval"
     
-    print(f"Filtered food items: {food_items}")
+    cached = recipe_cache.get(food_items)
+    if cached is not None:
+        logger.debug("Using cached recipe")
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - start, stage="recipe")
+        return cached, "cache"
     
+    if not use_model:
+        recipe = template_recipe(food_items)
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - start, stage="recipe")
+        return recipe, "template"
+    
+    recipe, source = _generate_recipe_uncached(food_items, deadline)
+    elapsed = time.perf_counter() - start
+    metrics.STAGE_SECONDS.observe(elapsed, stage="recipe")
+    # The cost includes any GPT-2 attempt that ended in the template fallback
+    recipe_cache.put(food_items, recipe, elapsed, source)
+    return recipe, source
+
+def _generate_recipe_uncached(food_items: list, deadline: float = None) -> tuple:
+    """Returns ``(recipe, source)`` where source is "model" or "template"."""
     # Try to use GPT-2 for recipe generation if available
     try:
-        # Create a prompt for recipe generation
-        prompt = f"Recipe with ingredients: {', '.join(food_items)}\n\n"
-        print(f"Using prompt for recipe generation: {prompt}")
+        logger.debug("Generating recipe with GPT-2 for: %s", food_items)
         
-        # Generate recipe using GPT-2
-        inputs = recipe_tokenizer(prompt, return_tensors="pt")
-        outputs = recipe_model.generate(
-            inputs["input_ids"],
-            max_length=300,  # Increased max length for more detailed recipes
-            num_return_sequences=1,
-            temperature=0.8,  # Slightly increased temperature for more creativity
-            no_repeat_ngram_size=2
-        )
-        recipe = recipe_tokenizer.decode(outputs[0], skip_special_tokens=True)
+        # Generate recipe using GPT-2; the shared prompt prefix is already
+        # encoded, and concurrent requests are batched together
+        tracker = DeadlineTracker(deadline_after(RECIPE_DEADLINE_S, deadline), "recipe")
+        recipe = recipe_batcher.submit((food_items, tracker)).result()
         
-        # Clean up the generated recipe
-        recipe = recipe.replace(prompt, "")
-        print(f"Generated recipe from model: {recipe[:100]}...")
+        if tracker.triggered:
+            # Out of time: keep only whole sentences
+            recipe = trim_to_boundary(recipe)
+        logger.debug("Generated recipe from model: %.100s...", recipe)
         
-        # If the recipe is too short or doesn't look like a proper recipe, fall back to template
-        if len(recipe.split('\n')) < 3 or 'ingredient' not in recipe.lower():
-            print("Generated recipe doesn't look complete, falling back to template")
+        if not is_complete_recipe(recipe):
+            logger.debug("Generated recipe doesn't look complete, falling back to template")
             raise Exception("Recipe doesn't look complete")
         
-        return recipe
+        return recipe, "model"
     
     except Exception as e:
-        print(f"Error generating recipe with GPT-2: {e}")
-        print("Falling back to template-based recipe generation")
-        
-        # Fallback to template-based recipe generation
-        recipe_templates = [
-            "RECIPE_TITLE\n\nIngredients:\n{ingredients}\n\nInstructions:\n1. Preheat the oven to 375°F (190°C).\n2. Prepare all ingredients: wash, peel, and chop as needed.\n3. {step_with_main_ingredient}\n4. {step_with_secondary_ingredient}\n5. Cook for about 20-25 minutes until done.\n6. Season with salt, pepper, and herbs to taste.\n7. Serve hot and enjoy!",
-            
-            "RECIPE_TITLE\n\nIngredients:\n{ingredients}\n\nInstructions:\n1. Heat oil in a large pan over medium heat.\n2. {step_with_main_ingredient}\n3. {step_with_secondary_ingredient}\n4. Add the remaining ingredients and cook for 10-15 minutes.\n5. Season with salt and pepper to taste.\n6. Garnish and serve immediately.",
-            
-            "RECIPE_TITLE\n\nIngredients:\n{ingredients}\n\nInstructions:\n1. {step_with_main_ingredient}\n2. In a separate bowl, combine all spices and seasonings.\n3. {step_with_secondary_ingredient}\n4. Mix everything together and cook for 15-20 minutes.\n5. Check for doneness and adjust seasonings if needed.\n6. Let rest for 5 minutes before serving."
-        ]
-        
-        # Select a random template
-        template = random.choice(recipe_templates)
-        
-        # Add some common cooking ingredients that might not be in the image
-        common_additions = ["Salt and pepper to taste", "2 tablespoons olive oil", "1 clove garlic, minced", 
-                           "Fresh herbs for garnish", "1/2 teaspoon paprika", "1 tablespoon butter"]
-        
-        # Add 2-3 common ingredients to the food items
-        food_items.extend(random.sample(common_additions, min(3, len(common_additions))))
-        
-        # Format the ingredients list
-        ingredients_text = "\n".join([f"- {item}" for item in food_items])
-        
-        # Get the main ingredient (first one in the list)
-        main_ingredient = food_items[0] if food_items else "ingredients"
-        secondary_ingredient = food_items[1] if len(food_items) > 1 else "other ingredients"
+        logger.info("Recipe model failed (%s), falling back to template-based recipe generation", e)
+        metrics.TEMPLATE_FALLBACKS.inc()
+        return template_recipe(food_items), "template"
+
+def template_recipe(food_items: list) -> str:
+    # Fallback to template-based recipe generation
+    food_items = list(food_items)
+    recipe_templates = [
+        "RECIPE_TITLE\n\nIngredients:\n{ingredients}\n\nInstructions:\n1. Preheat the oven to 375°F (190°C).\n2. Prepare all ingredients: wash, peel, and chop as needed.\n3. {step_with_main_ingredient}\n4. {step_with_secondary_ingredient}\n5. Cook for about 20-25 minutes until done.\n6. Season with salt, pepper, and herbs to taste.\n7. Serve hot and enjoy!",
         
-        # Create steps with the main ingredient
-        steps_with_main = [
-            f"Add the {main_ingredient} to the pan and sauté until golden.",
-            f"Place the {main_ingredient} in a baking dish and season well.",
-            f"Combine the {main_ingredient} with spices and mix thoroughly.",
-            f"Cut the {main_ingredient} into bite-sized pieces and set aside.",
-            f"In a large bowl, marinate the {main_ingredient} with olive oil and spices."
-        ]
+        "RECIPE_TITLE\n\nIngredients:\n{ingredients}\n\nInstructions:\n1. Heat oil in a large pan over medium heat.\n2. {step_with_main_ingredient}\n3. {step_with_secondary_ingredient}\n4. Add the remaining ingredients and cook for 10-15 minutes.\n5. Season with salt and pepper to taste.\n6. Garnish and serve immediately.",
         
-        # Create steps with the secondary ingredient
-        steps_with_secondary = [
-            f"Add the {secondary_ingredient} and cook for another 5 minutes.",
-            f"Sprinkle the {secondary_ingredient} over the top and continue cooking.",
-            f"Mix in the {secondary_ingredient} until well combined.",
-            f"Layer the {secondary_ingredient} on top and bake until golden.",
-            f"Stir in the {secondary_ingredient} and simmer for 10 minutes."
-        ]
+        "RECIPE_TITLE\n\nIngredients:\n{ingredients}\n\nInstructions:\n1. {step_with_main_ingredient}\n2. In a separate bowl, combine all spices and seasonings.\n3. {step_with_secondary_ingredient}\n4. Mix everything together and cook for 15-20 minutes.\n5. Check for doneness and adjust seasonings if needed.\n6. Let rest for 5 minutes before serving."
+    ]
+    
+    # Select a random template
+    template = random.choice(recipe_templates)
+    
+    # Add some common cooking ingredients that might not be in the image
+    common_additions = ["Salt and pepper to taste", "2 tablespoons olive oil", "1 clove garlic, minced", 
+                       "Fresh herbs for garnish", "1/2 teaspoon paprika", "1 tablespoon butter"]
+    
+    # Add 2-3 common ingredients to the food items
+    food_items.extend(random.sample(common_additions, min(3, len(common_additions))))
+    
+    # Format the ingredients list
+    ingredients_text = "\n".join([f"- {item}" for item in food_items])
+    
+    # Get the main ingredient (first one in the list)
+    main_ingredient = food_items[0] if food_items else "ingredients"
+    secondary_ingredient = food_items[1] if len(food_items) > 1 else "other ingredients"
+    
+    # Create steps with the main ingredient
+    steps_with_main = [
+        f"Add the {main_ingredient} to the pan and sauté until golden.",
+        f"Place the {main_ingredient} in a baking dish and season well.",
+        f"Combine the {main_ingredient} with spices and mix thoroughly.",
+        f"Cut the {main_ingredient} into bite-sized pieces and set aside.",
+        f"In a large bowl, marinate the {main_ingredient} with olive oil and spices."
+    ]
+    
+    # Create steps with the secondary ingredient
+    steps_with_secondary = [
+        f"Add the {secondary_ingredient} and cook for another 5 minutes.",
+        f"Sprinkle the {secondary_ingredient} over the top and continue cooking.",
+        f"Mix in the {secondary_ingredient} until well combined.",
+        f"Layer the {secondary_ingredient} on top and bake until golden.",
+        f"Stir in the {secondary_ingredient} and simmer for 10 minutes."
+    ]
+    
+    # Replace placeholders in the template
+    recipe = template.replace("{ingredients}", ingredients_text)
+    recipe = recipe.replace("{step_with_main_ingredient}", random.choice(steps_with_main))
+    recipe = recipe.replace("{step_with_secondary_ingredient}", random.choice(steps_with_secondary))
+    
+    # Generate a title based on ingredients
+    if "potato" in str(food_items).lower():
+        titles = ["Delicious Potato Dish", "Roasted Potato Medley", "Potato Comfort Food", "Creamy Potato Casserole", "Herb-Infused Potato Recipe"]
+    elif "chicken" in str(food_items).lower():
+        titles = ["Savory Chicken Recipe", "Herb-Roasted Chicken", "Classic Chicken Dish", "Tender Chicken Delight", "Spiced Chicken Creation"]
+    elif "vegetable" in str(food_items).lower() or "vegetables" in str(food_items).lower():
+        titles = ["Garden Vegetable Medley", "Roasted Vegetable Platter", "Seasonal Vegetable Dish", "Colorful Vegetable Stir-Fry", "Vegetable Harmony Bowl"]
+    elif "beef" in str(food_items).lower():
+        titles = ["Hearty Beef Stew", "Tender Beef Recipe", "Savory Beef Dish", "Slow-Cooked Beef Delight", "Spiced Beef Creation"]
+    elif "fish" in str(food_items).lower() or "salmon" in str(food_items).lower():
+        titles = ["Delicate Fish Recipe", "Perfectly Seasoned Fish", "Baked Fish Delight", "Zesty Fish Creation", "Herb-Crusted Fish Dish"]
+    else:
+        titles = [f"{main_ingredient.title()} Special", f"Homemade {main_ingredient.title()} Recipe", f"Easy {main_ingredient.title()} Dish", 
+                 f"Gourmet {main_ingredient.title()} Creation", f"Delicious {main_ingredient.title()} Medley"]
+    
+    recipe = recipe.replace("RECIPE_TITLE", random.choice(titles))
+    logger.debug("Generated template recipe: %.100s...", recipe)
+    
+    return recipe
+
+def _stream_text(text: str):
+    # Stream template text a line at a time, like generated tokens would arrive
+    for line in text.splitlines(keepends=True):
+        yield line
+
+def stream_recipe(ingredients: list):
+    """Generate a recipe incrementally.
+
+    Yields ``(event, text)`` pairs: ``("token", piece)`` as GPT-2 produces
+    text, ``("reset", "")`` if the streamed model output is being replaced
+    (by a template when it turned out incomplete, or by its trimmed version
+    when the deadline cut it off mid-sentence), and finally ``("done", recipe)`` with
+    the full recipe.
+    """
+    food_items = filter_recipe_ingredients(ingredients)
+    if not food_items:
+        recipe = "No food items detected to generate a recipe."
+        yield "token", recipe
+        yield "done", recipe
+        return
+    
+    start = time.perf_counter()
+    # A retrieved or cached recipe needs no model
+    ready = _retrieve_recipe(food_items) or recipe_cache.get(food_items)
+    if ready is not None:
+        yield from (("token", piece) for piece in _stream_text(ready))
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - start, stage="recipe")
+        yield "done", ready
+        return
+    
+    source = "model"
+    streamed = []
+    try:
+        from transformers import TextIteratorStreamer
         
-        # Replace placeholders in the template
-        recipe = template.replace("{ingredients}", ingredients_text)
-        recipe = recipe.replace("{step_with_main_ingredient}", random.choice(steps_with_main))
-        recipe = recipe.replace("{step_with_secondary_ingredient}", random.choice(steps_with_secondary))
+        generator = registry.get("recipe")
+        streamer = TextIteratorStreamer(generator.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        tracker = DeadlineTracker(deadline_after(RECIPE_DEADLINE_S), "recipe")
+        errors = []
         
-        # Generate a title based on ingredients
-        if "potato" in str(food_items).lower():
-            titles = ["Delicious Potato Dish", "Roasted Potato Medley", "Potato Comfort Food", "Creamy Potato Casserole", "Herb-Infused Potato Recipe"]
-        elif "chicken" in str(food_items).lower():
-            titles = ["Savory Chicken Recipe", "Herb-Roasted Chicken", "Classic Chicken Dish", "Tender Chicken Delight", "Spiced Chicken Creation"]
-        elif "vegetable" in str(food_items).lower() or "vegetables" in str(food_items).lower():
-            titles = ["Garden Vegetable Medley", "Roasted Vegetable Platter", "Seasonal Vegetable Dish", "Colorful Vegetable Stir-Fry", "Vegetable Harmony Bowl"]
-        elif "beef" in str(food_items).lower():
-            titles = ["Hearty Beef Stew", "Tender Beef Recipe", "Savory Beef Dish", "Slow-Cooked Beef Delight", "Spiced Beef Creation"]
-        elif "fish" in str(food_items).lower() or "salmon" in str(food_items).lower():
-            titles = ["Delicate Fish Recipe", "Perfectly Seasoned Fish", "Baked Fish Delight", "Zesty Fish Creation", "Herb-Crusted Fish Dish"]
-        else:
-            titles = [f"{main_ingredient.title()} Special", f"Homemade {main_ingredient.title()} Recipe", f"Easy {main_ingredient.title()} Dish", 
-                     f"Gourmet {main_ingredient.title()} Creation", f"Delicious {main_ingredient.title()} Medley"]
+        def _generate():
+            try:
+                generator.generate([food_items], RECIPE_MAX_NEW_TOKENS, [tracker], streamer=streamer)
+            except Exception as e:
+                # Unblock the consumer loop below
+                errors.append(e)
+                streamer.end()
         
-        recipe = recipe.replace("RECIPE_TITLE", random.choice(titles))
-        print(f"Generated template recipe: {recipe[:100]}...")
+        generation = threading.Thread(target=_generate, name="recipe-stream", daemon=True)
+        generation.start()
+        for piece in streamer:
+            if piece:
+                streamed.append(piece)
+                yield "token", piece
+        generation.join()
+        if errors:
+            raise errors[0]
         
-        return recipe
+        recipe = "".join(streamed)
+        if tracker.triggered:
+            # Out of time: replace what was streamed with its whole sentences
+            trimmed = trim_to_boundary(recipe)
+            if trimmed != recipe:
+                yield "reset", ""
+                streamed = [trimmed]
+                recipe = trimmed
+                yield "token", recipe
+        if not is_complete_recipe(recipe):
+            raise Exception("Recipe doesn't look complete")
+    except Exception as e:
+        logger.info("Recipe model failed while streaming (%s), falling back to template-based recipe generation", e)
+        metrics.TEMPLATE_FALLBACKS.inc()
+        if streamed:
+            yield "reset", ""
+        recipe = template_recipe(food_items)
+        source = "template"
+        yield from (("token", piece) for piece in _stream_text(recipe))
+    
+    elapsed = time.perf_counter() - start
+    metrics.STAGE_SECONDS.observe(elapsed, stage="recipe")
+    recipe_cache.put(food_items, recipe, elapsed, source)
+    yield "done", recipe
 
 # --- OpenCV Webcam Loop ---
-def run_webcam():
-    cap = cv2.VideoCapture(0)
+def run_webcam(source=0):
+    cap = open_source(source)
     print("🎥 Webcam started. Press 'c' to capture, 'q' to quit.")
 
     while True:
@@ -221,11 +508,9 @@ def run_webcam():
         if key == ord('c'):
             print("📸 Capturing image...")
             rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            pil_img = Image.fromarray(rgb_frame)
 
             print("🔍 Detecting ingredients...")
-            caption = get_caption(pil_img)
-            detected = get_detected_ingredients(pil_img)
+            caption, detected = analyze_image(rgb_frame)
 
             ingredients = list(set(detected + caption.split()))
             print("🥦 Ingredients:", ingredients)
@@ -244,5 +529,97 @@ def run_webcam():
     cap.release()
     cv2.destroyAllWindows()
 
+def _analyze_frame(frame: np.ndarray) -> dict:
+    caption, detected = analyze_image(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    return {"caption": caption, "ingredients": combine_ingredients(caption, detected)}
+
+def _print_recipe(future):
+    try:
+        print("\n🍽️ Recipe from AI:\n")
+        print(future.result())
+    except Exception as e:
+        print(f"❌ Recipe generation failed: {e}")
+
+def run_webcam_continuous(source=0, change_threshold: float = 0.06, refresh_s: float = 0.0,
+                          headless: bool = False, max_frames: int = 0) -> dict:
+    """Live mode: analyze the feed continuously and overlay the results.
+
+    Caption and detection run on a background worker. While it is busy, or
+    while the scene has not changed since the last analyzed frame, frames
+    are only displayed, so a static scene costs next to no CPU. Press 'c' to
+    generate a recipe from the latest ingredients, 'q' to quit.
+
+    ``source`` may be a video file, which is paced at its native frame rate;
+    with ``headless`` the file is played once without a window and the
+    analyzer's counters are returned, which makes the mode testable.
+    """
+    cap = open_source(source)
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open camera source {source!r}")
+    is_file = isinstance(source, str) and not source.isdigit() and source != "synthetic"
+    fps = cap.get(cv2.CAP_PROP_FPS) if is_file else 0
+    frame_interval = 1.0 / fps if fps and fps > 0 else 0
+
+    analyzer = LiveAnalyzer(_analyze_frame, SceneChangeDetector(change_threshold), refresh_s)
+    analyzer.start()
+    if not headless:
+        print("🎥 Live mode started. Press 'c' for a recipe, 'q' to quit.")
+
+    frames = 0
+    try:
+        while not max_frames or frames < max_frames:
+            read_started = time.monotonic()
+            ret, frame = cap.read()
+            if not ret:
+                if is_file and not headless:
+                    # Loop the file so it behaves like a live source
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    continue
+                break
+            frames += 1
+            analyzer.offer(frame)
+
+            if not headless:
+                cv2.imshow("RecipeSnap - Live", draw_overlay(frame, analyzer.result, analyzer.busy))
+                key = cv2.waitKey(1)
+                if key == ord('q'):
+                    break
+                if key == ord('c') and analyzer.result and "ingredients" in analyzer.result:
+                    print("👩‍🍳 Generating recipe...")
+                    # Off the display loop, so the video keeps running
+                    future = _get_pipeline_pool().submit(generate_recipe, analyzer.result["ingredients"])
+                    future.add_done_callback(_print_recipe)
+
+            if frame_interval:
+                remaining = frame_interval - (time.monotonic() - read_started)
+                if remaining > 0:
+                    time.sleep(remaining)
+    finally:
+        analyzer.stop()
+        cap.release()
+        if not headless:
+            cv2.destroyAllWindows()
+
+    return {"frames": frames, **analyzer.counters, "result": analyzer.result}
+
 if __name__ == "__main__":
-    run_webcam()
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="RecipeSnap webcam client")
+    parser.add_argument("--source", default="0", help="Camera index, video file, or 'synthetic'")
+    parser.add_argument("--continuous", action="store_true", help="Analyze continuously instead of on 'c'")
+    parser.add_argument("--change-threshold", type=float, default=0.06,
+                        help="Scene change (mean pixel difference, 0-1) that triggers a new analysis")
+    parser.add_argument("--refresh", type=float, default=0.0, help="Re-analyze a static scene every N seconds (0 = never)")
+    parser.add_argument("--headless", action="store_true", help="No window; play the source once and print stats")
+    parser.add_argument("--max-frames", type=int, default=0)
+    args = parser.parse_args()
+
+    source = int(args.source) if args.source.isdigit() else args.source
+    if args.continuous:
+        stats = run_webcam_continuous(source, args.change_threshold, args.refresh, args.headless, args.max_frames)
+        if args.headless:
+            print(json.dumps(stats, indent=2, default=str))
+    else:
+        run_webcam(source)
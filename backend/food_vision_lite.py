@@ -6,41 +6,44 @@ from transformers import (
     DetrForObjectDetection, DetrImageProcessor,
 )
 
+from inference import get_precision_mode, inference_context, prepare_model
+from vocabulary import food_label_table
+
 # --- Load Models ---
 print("Loading lightweight models for testing...")
 
 # Image Captioning - Using a smaller model
-caption_model = VisionEncoderDecoderModel.from_pretrained("nlpconnect/vit-gpt2-image-captioning")
+caption_model = prepare_model(VisionEncoderDecoderModel.from_pretrained("nlpconnect/vit-gpt2-image-captioning"), get_precision_mode())
 caption_processor = ViTImageProcessor.from_pretrained("nlpconnect/vit-gpt2-image-captioning")
 caption_tokenizer = AutoTokenizer.from_pretrained("nlpconnect/vit-gpt2-image-captioning")
 
 # Object Detection - Using DETR but with lower threshold
-det_model = DetrForObjectDetection.from_pretrained("facebook/detr-resnet-50")
+det_model = prepare_model(DetrForObjectDetection.from_pretrained("facebook/detr-resnet-50"), get_precision_mode())
 det_processor = DetrImageProcessor.from_pretrained("facebook/detr-resnet-50")
+# Food-related DETR classes, from the vocabulary shared with the full backend
+food_labels = food_label_table(det_model.config.id2label)
 
 print("Models loaded successfully.")
 
 # --- Helper Functions ---
 def get_caption(image: Image.Image) -> str:
     inputs = caption_processor(images=image, return_tensors="pt").pixel_values
-    outputs = caption_model.generate(inputs, max_length=64)
+    with inference_context(caption_model):
+        outputs = caption_model.generate(inputs, max_length=64)
     return caption_tokenizer.decode(outputs[0], skip_special_tokens=True)
 
 def get_detected_ingredients(image: Image.Image) -> list:
     inputs = det_processor(images=image, return_tensors="pt")
-    outputs = det_model(**inputs)
+    with inference_context(det_model):
+        outputs = det_model(**inputs)
     target_sizes = torch.tensor([image.size[::-1]])
     results = det_processor.post_process_object_detection(outputs, threshold=0.5, target_sizes=target_sizes)[0]
     
     # Filter for food-related objects
-    food_categories = ["banana", "apple", "sandwich", "orange", "broccoli", "carrot", 
-                       "hot dog", "pizza", "donut", "cake", "bowl", "cup", "fork", "knife", 
-                       "spoon", "food", "fruit", "vegetable"]
-    
     labels = []
-    for i, label in enumerate(results["labels"]):
-        label_name = det_model.config.id2label[label.item()]
-        if any(food in label_name.lower() for food in food_categories):
+    for label_id in results["labels"].tolist():
+        label_name = food_labels.get(label_id)
+        if label_name is not None:
             labels.append(label_name)
     
     return list(set(labels))
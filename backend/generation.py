@@ -0,0 +1,83 @@
+"""Time-bounded decoding for the caption and recipe models.
+
+``deadline_criteria`` builds a transformers StoppingCriteria that ends
+``generate`` once a wall-clock deadline passes, keeping what was decoded so
+far; ``trim_to_boundary`` then cuts that partial text back to the last
+complete sentence or line. Truncations are counted per model on
+/api/metrics. Only the criteria touch torch, and they import it lazily, so
+the ONNX backend can share the rest.
+"""
+import re
+import time
+
+import metrics
+
+DEADLINE_TRUNCATIONS = metrics.registry.counter(
+    "recipesnap_generation_deadline_truncations_total",
+    "Generate calls cut short by their wall-clock deadline, by model.", ("model",))
+
+# A sentence end followed by whitespace, a line break, or the gap before an
+# inline step number ("... 2. Add"). The period of a step number itself
+# ("2.") is not a sentence end, so a cut never leaves a dangling marker.
+_BOUNDARY = re.compile(r"(?<!\d)[.!?](?=\s)|\n|(?=\s+\d+\.\s)")
+
+
+class DeadlineTracker:
+    """Remembers whether a deadline ended a generate call."""
+
+    def __init__(self, deadline: float, model: str):
+        self.deadline = deadline
+        self.model = model
+        self.triggered = False
+
+    def expired(self) -> bool:
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            if not self.triggered:
+                self.triggered = True
+                DEADLINE_TRUNCATIONS.inc(model=self.model)
+            return True
+        return False
+
+
+def _criteria_returns_tensor() -> bool:
+    # transformers >= 4.39 expects a per-sequence bool tensor, older versions a bool
+    import transformers
+
+    major, minor = (int(part) for part in transformers.__version__.split(".")[:2])
+    return (major, minor) >= (4, 39)
+
+
+def deadline_criteria(tracker: DeadlineTracker):
+    """A StoppingCriteriaList that stops generation once ``tracker`` expires."""
+    import torch
+    from transformers import StoppingCriteria, StoppingCriteriaList
+
+    as_tensor = _criteria_returns_tensor()
+
+    class _DeadlineCriteria(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            expired = tracker.expired()
+            if as_tensor:
+                return torch.full((input_ids.shape[0],), expired, dtype=torch.bool, device=input_ids.device)
+            return expired
+
+    return StoppingCriteriaList([_DeadlineCriteria()])
+
+
+def trim_to_boundary(text: str) -> str:
+    """Cut partial output back to its last complete sentence or line.
+
+    Text with no boundary at all (a short caption) is returned as is.
+    """
+    matches = list(_BOUNDARY.finditer(text))
+    if not matches:
+        return text.strip()
+    return text[:matches[-1].end()].rstrip()
+
+
+def deadline_after(seconds: float, deadline: float = None) -> float:
+    """The earlier of ``now + seconds`` (if seconds > 0) and ``deadline``."""
+    own = time.perf_counter() + seconds if seconds and seconds > 0 else None
+    if own is None or deadline is None:
+        return own if deadline is None else deadline
+    return min(own, deadline)
@@ -0,0 +1,89 @@
+import io
+import os
+import time
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from uploads import UploadError
+
+# DETR resizes to a shortest edge of 800 (longest at most 1333) and ViT to
+# 224x224, so nothing downstream uses more pixels than this.
+TARGET_SHORTEST_EDGE = 800
+TARGET_LONGEST_EDGE = 1333
+
+# Refuse images above this many pixels before decoding them (50 MP allows
+# any phone camera but rejects decompression bombs)
+DEFAULT_MAX_PIXELS = int(os.environ.get("MAX_IMAGE_PIXELS", str(50_000_000)))
+
+
+def target_size(width: int, height: int,
+                shortest_edge: int = TARGET_SHORTEST_EDGE, longest_edge: int = TARGET_LONGEST_EDGE) -> tuple:
+    """Size the image would be resized to for DETR, never larger than it is."""
+    scale = min(shortest_edge / min(width, height), longest_edge / max(width, height), 1.0)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _to_rgb(image: Image.Image) -> Image.Image:
+    if image.mode == "RGB":
+        return image
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        # Transparent areas become white rather than whatever colour the
+        # hidden pixels happen to hold
+        rgba = image.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+
+def decode_image(source, max_pixels: int = DEFAULT_MAX_PIXELS,
+                 shortest_edge: int = TARGET_SHORTEST_EDGE, longest_edge: int = TARGET_LONGEST_EDGE) -> tuple:
+    """Decode an upload straight to the resolution the models need.
+
+    ``source`` is image bytes, a path or a file object. Returns
+    ``(pixels, info)``: an RGB uint8 array and a dict with the original and
+    decoded sizes and the decode time. JPEGs are decoded at a reduced DCT
+    scale (PIL draft mode), so a 12 MP photo is never materialized at full
+    size; the result is then resized to DETR's input size, EXIF rotation is
+    applied, and the mode is normalized to RGB once.
+
+    Raises UploadError (400) for undecodable data and (413) for images over
+    ``max_pixels``.
+    """
+    start = time.perf_counter()
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    try:
+        image = Image.open(source)
+    except Exception as e:
+        raise UploadError(f"Could not decode image: {e}", 400)
+
+    # Only the header has been read so far
+    width, height = image.size
+    if width * height > max_pixels:
+        raise UploadError(f"Image is {width}x{height}, over the limit of {max_pixels} pixels", 413)
+
+    target = target_size(width, height, shortest_edge, longest_edge)
+    try:
+        if image.format == "JPEG":
+            # Picks the largest 1/2, 1/4 or 1/8 scale that is still >= target
+            image.draft("RGB", target)
+        image = ImageOps.exif_transpose(image)
+        image = _to_rgb(image)
+        # exif_transpose may have swapped the axes
+        target = target_size(*image.size, shortest_edge, longest_edge)
+        if image.size != target:
+            image = image.resize(target, Image.BILINEAR, reducing_gap=2.0)
+        pixels = np.asarray(image)
+    except UploadError:
+        raise
+    except Exception as e:
+        raise UploadError(f"Could not decode image: {e}", 400)
+
+    info = {
+        "original_size": [width, height],
+        "decoded_size": [pixels.shape[1], pixels.shape[0]],
+        "decode_ms": round((time.perf_counter() - start) * 1000, 2),
+    }
+    return pixels, info
@@ -0,0 +1,56 @@
+import contextlib
+import os
+
+import torch
+
+# fp32: eager float32 (reference)
+# int8: dynamic int8 quantization of Linear layers, activations stay float
+# bf16: bfloat16 autocast, fastest on CPUs with AVX512-BF16 / AMX
+PRECISION_MODES = ("fp32", "int8", "bf16")
+
+
+def get_precision_mode() -> str:
+    mode = os.environ.get("INFERENCE_PRECISION", "fp32").lower()
+    if mode not in PRECISION_MODES:
+        raise ValueError(f"INFERENCE_PRECISION must be one of {PRECISION_MODES}, got {mode!r}")
+    return mode
+
+
+def _conv1d_to_linear(module: torch.nn.Module):
+    # GPT-2 blocks use transformers' Conv1D, which dynamic quantization does
+    # not recognise. It is a Linear with a transposed weight, so swap it.
+    from transformers.pytorch_utils import Conv1D
+
+    for name, child in module.named_children():
+        if isinstance(child, Conv1D):
+            in_features, out_features = child.weight.shape
+            linear = torch.nn.Linear(in_features, out_features)
+            linear.weight.data = child.weight.data.t().contiguous()
+            linear.bias.data = child.bias.data
+            setattr(module, name, linear)
+        else:
+            _conv1d_to_linear(child)
+
+
+def prepare_model(model: torch.nn.Module, mode: str) -> torch.nn.Module:
+    """Put a model in eval mode and apply the precision mode to it."""
+    if mode not in PRECISION_MODES:
+        raise ValueError(f"INFERENCE_PRECISION must be one of {PRECISION_MODES}, got {mode!r}")
+    model.eval()
+    if mode == "int8":
+        _conv1d_to_linear(model)
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    model.inference_precision = mode
+    return model
+
+
+def inference_context(model: torch.nn.Module):
+    """Context for a forward pass or generate call on a prepared model.
+
+    Always disables autograd tracking; bf16 models also run under CPU autocast.
+    """
+    stack = contextlib.ExitStack()
+    stack.enter_context(torch.inference_mode())
+    if getattr(model, "inference_precision", "fp32") == "bf16":
+        stack.enter_context(torch.autocast("cpu", dtype=torch.bfloat16))
+    return stack
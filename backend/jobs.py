@@ -0,0 +1,274 @@
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+QUEUE_DEPTH = metrics.registry.gauge(
+    "recipesnap_job_queue_depth", "Jobs waiting for a worker.", ("queue",))
+JOBS_RUNNING = metrics.registry.gauge(
+    "recipesnap_jobs_running", "Jobs currently being processed.", ("queue",))
+JOB_WAIT_SECONDS = metrics.registry.histogram(
+    "recipesnap_job_wait_seconds", "Time jobs spent queued before a worker picked them up.", ("queue",))
+JOB_RUN_SECONDS = metrics.registry.histogram(
+    "recipesnap_job_run_seconds", "Time jobs spent being processed.", ("queue",))
+JOBS = metrics.registry.counter(
+    "recipesnap_jobs_total", "Jobs by outcome: completed, failed or rejected (queue full).", ("queue", "outcome"))
+
+
+class QueueFull(Exception):
+    """The job queue is at capacity; retry after ``retry_after`` seconds."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Job queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Job:
+    def __init__(self, fn, args: tuple):
+        self.id = uuid.uuid4().hex
+        self.fn = fn
+        self.args = args
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._done = threading.Event()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._done.wait(timeout)
+
+    def to_dict(self) -> dict:
+        body = {"jobId": self.id, "status": self.status, "submittedAt": self.submitted_at}
+        if self.started_at is not None:
+            body["waitSeconds"] = round(self.started_at - self.submitted_at, 3)
+        if self.finished_at is not None:
+            body["runSeconds"] = round(self.finished_at - self.started_at, 3)
+        if self.status == "done":
+            body["result"] = self.result
+        elif self.status == "error":
+            body["error"] = self.error
+        return body
+
+
+class StoredJob:
+    """A job owned by another worker process, as last written to the store."""
+
+    POLL_INTERVAL_S = 0.2
+
+    def __init__(self, path: str, body: dict):
+        self.path = path
+        self.body = body
+        self.id = body["jobId"]
+
+    @property
+    def status(self) -> str:
+        return self.body["status"]
+
+    def wait(self, timeout: float = None) -> bool:
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while self.status not in ("done", "error"):
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(self.POLL_INTERVAL_S)
+            body = _read_job_file(self.path)
+            if body is None:
+                return False  # Expired meanwhile
+            self.body = body
+        return True
+
+    def to_dict(self) -> dict:
+        return self.body
+
+
+_JOB_ID = re.compile(r"[0-9a-f]{32}")
+
+
+def _read_job_file(path: str):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class JobQueue:
+    """Runs submitted jobs on a fixed pool of worker threads.
+
+    The queue is bounded: ``submit`` raises QueueFull instead of letting work
+    pile up, so overload turns into a fast rejection the client can retry.
+    Finished jobs are kept for ``result_ttl`` seconds for polling.
+
+    Jobs live in the process that accepted them. With ``store_dir`` set,
+    every status change is also written to ``<store_dir>/<job id>.json``, so
+    any process sharing the directory (pre-forked workers) can answer
+    ``get`` for any job.
+    """
+
+    def __init__(self, workers: int = 2, max_queued: int = 32, result_ttl: float = 600.0, name: str = "jobs",
+                 store_dir: str = None):
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        self.workers = workers
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self.name = name
+        self.store_dir = None
+        if store_dir:
+            self.use_store(store_dir)
+        self._last_sweep = 0.0
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        self._pid = None
+        # Moving average of run time, for the Retry-After estimate
+        self._mean_run_s = 1.0
+
+    def submit(self, fn, *args) -> Job:
+        self._ensure_workers()
+        self._expire()
+        job = Job(fn, args)
+        with self._lock:
+            self._jobs[job.id] = job
+        # Stored before a worker can pick it up, so the writes stay in order
+        self._persist(job)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+            self._unpersist(job.id)
+            JOBS.inc(queue=self.name, outcome="rejected")
+            raise QueueFull(self.retry_after())
+        QUEUE_DEPTH.set(self._queue.qsize(), queue=self.name)
+        return job
+
+    def get(self, job_id: str):
+        """The Job, a StoredJob if another process owns it, or None."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None or self.store_dir is None or not _JOB_ID.fullmatch(job_id):
+            return job
+        path = self._job_path(job_id)
+        body = _read_job_file(path)
+        return StoredJob(path, body) if body is not None else None
+
+    def use_store(self, store_dir: str):
+        """Share job state through ``store_dir`` (call before forking workers)."""
+        os.makedirs(store_dir, exist_ok=True)
+        self.store_dir = store_dir
+
+    def _job_path(self, job_id: str) -> str:
+        return os.path.join(self.store_dir, job_id + ".json")
+
+    def _persist(self, job: Job):
+        if self.store_dir is None:
+            return
+        path = self._job_path(job.id)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(job.to_dict(), f)
+            # Readers never see a partly written file
+            os.replace(tmp, path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning("Could not store job %s: %s", job.id, e)
+
+    def _unpersist(self, job_id: str):
+        if self.store_dir is None:
+            return
+        try:
+            os.remove(self._job_path(job_id))
+        except OSError:
+            pass
+
+    def retry_after(self) -> int:
+        """Seconds until a queue slot is likely to free up."""
+        return max(1, round(self._mean_run_s * self._queue.qsize() / self.workers))
+
+    def stats(self) -> dict:
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize(),
+            "max_queued": self.max_queued,
+            "running": statuses.count("running"),
+            "mean_run_seconds": round(self._mean_run_s, 3),
+        }
+
+    def _expire(self):
+        cutoff = time.time() - self.result_ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and job.finished_at < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+        if self.store_dir is None or time.time() - self._last_sweep < 60:
+            return
+        # Other processes' jobs too; a file's mtime is its last status change
+        self._last_sweep = time.time()
+        try:
+            entries = list(os.scandir(self.store_dir))
+        except OSError:
+            return
+        for entry in entries:
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+    def _ensure_workers(self):
+        # Started lazily, and again in a forked child, like MicroBatcher
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                self._queue = queue.Queue(maxsize=self.max_queued)
+                self._jobs = {}
+            self._pid = os.getpid()
+            self._threads = [
+                threading.Thread(target=self._run, name=f"{self.name}-worker-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            QUEUE_DEPTH.set(self._queue.qsize(), queue=self.name)
+            job.started_at = time.time()
+            job.status = "running"
+            self._persist(job)
+            JOB_WAIT_SECONDS.observe(job.started_at - job.submitted_at, queue=self.name)
+            with JOBS_RUNNING.track_inprogress(queue=self.name):
+                try:
+                    job.result = job.fn(*job.args)
+                    job.status = "done"
+                except Exception as e:
+                    logger.exception("Job %s failed", job.id)
+                    job.error = str(e)
+                    job.status = "error"
+            job.finished_at = time.time()
+            self._persist(job)
+            run_s = job.finished_at - job.started_at
+            self._mean_run_s = 0.8 * self._mean_run_s + 0.2 * run_s
+            JOB_RUN_SECONDS.observe(run_s, queue=self.name)
+            JOBS.inc(queue=self.name, outcome="completed" if job.status == "done" else "failed")
+            # Drop the input (image bytes) now that it has been used
+            job.fn = job.args = None
+            job._done.set()
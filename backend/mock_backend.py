@@ -1,19 +1,44 @@
+"""Model-free stand-in for the backend API.
+
+By default every request returns instantly with canned potato results,
+which is enough for frontend work. Set ``MOCK_LATENCY`` to make it behave
+like the real pipeline under load instead, for capacity planning of the
+frontend, proxy and queueing layers:
+
+* ``MOCK_LATENCY=profile:bench.json`` samples each stage's latency from a
+  report written by ``benchmark.py --output`` on the real backend (a
+  lognormal fitted to its p50 and p95);
+* ``MOCK_LATENCY=default`` uses built-in CPU figures, and
+  ``MOCK_LATENCY="caption=lognormal:900:0.3,recipe=uniform:2000:9000"``
+  overrides single stages (``fixed:ms``, ``uniform:lo:hi``,
+  ``normal:mean:sd``, ``lognormal:median:sigma``, all in ms).
+
+Caption and detection overlap as in the real server. ``MOCK_BURN=cpu``
+spins the CPU for the sampled time instead of sleeping (one core at a time,
+since the loop holds the GIL). ``MOCK_MAX_CONCURRENCY`` caps requests in
+progress; requests beyond it are rejected at once with a 429 and a
+Retry-After estimated from recent run times, like the real job queue. Responses vary in ingredients,
+detections and recipe length, so response sizes do too.
+"""
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-import base64
-import io
+import json
+import math
+import os
 import random
-from PIL import Image
+import threading
+import time
+
+from uploads import UploadError, read_image_upload, DEFAULT_MAX_UPLOAD_BYTES
+from vocabulary import INGREDIENT_KEYWORDS
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", DEFAULT_MAX_UPLOAD_BYTES))
+
 # Mock data for testing
-MOCK_INGREDIENTS = [
-    "tomato", "onion", "garlic", "chicken", "beef", "carrot", "potato",
-    "broccoli", "spinach", "rice", "pasta", "cheese", "egg", "mushroom",
-    "bell pepper", "olive oil", "salt", "pepper", "basil", "oregano"
-]
+MOCK_INGREDIENTS = list(INGREDIENT_KEYWORDS)
 
 # Specific ingredients for potato images
 POTATO_INGREDIENTS = ["potato", "butter", "salt", "pepper", "garlic"]
@@ -82,65 +107,127 @@ POTATO_RECIPES = [
 """
 ]
 
-# General mock recipes for other foods
-MOCK_RECIPES = [
-    """# Simple Pasta Recipe
+# --- Latency emulation ---
 
-## Ingredients:
-- Pasta
-- Tomatoes
-- Garlic
-- Olive oil
-- Salt
-- Pepper
-- Basil
+# Medians and spreads (ms) for fp32 on a laptop CPU, as in cascade.StageCosts
+DEFAULT_STAGE_LATENCY = {
+    "decode": ("lognormal", 15.0, 0.3),
+    "caption": ("lognormal", 1000.0, 0.3),
+    "detect": ("lognormal", 1000.0, 0.25),
+    "recipe": ("lognormal", 8000.0, 0.4),
+}
+STAGES = tuple(DEFAULT_STAGE_LATENCY)
 
-## Instructions:
-1. Cook pasta according to package instructions.
-2. Heat olive oil in a pan and add minced garlic.
-3. Add chopped tomatoes and cook for 5 minutes.
-4. Season with salt, pepper, and basil.
-5. Toss with cooked pasta and serve hot.
-""",
-    """# Quick Stir Fry
 
-## Ingredients:
-- Rice
-- Vegetables (carrots, bell peppers, broccoli)
-- Protein (chicken, beef, or tofu)
-- Soy sauce
-- Garlic
-- Ginger
-- Olive oil
+def sample_ms(dist: tuple) -> float:
+    kind, *params = dist
+    if kind == "fixed":
+        return params[0]
+    if kind == "uniform":
+        return random.uniform(params[0], params[1])
+    if kind == "normal":
+        return max(0.0, random.gauss(params[0], params[1]))
+    if kind == "lognormal":
+        return random.lognormvariate(math.log(params[0]), params[1])
+    raise ValueError(f"Unknown distribution {kind!r}")
 
-## Instructions:
-1. Cook rice according to package instructions.
-2. Heat oil in a wok or large pan.
-3. Add protein and cook until done.
-4. Add vegetables and stir fry for 3-5 minutes.
-5. Add minced garlic, ginger, and soy sauce.
-6. Serve hot over rice.
-""",
-    """# Easy Omelette
 
-## Ingredients:
-- Eggs
-- Cheese
-- Vegetables (onions, bell peppers, tomatoes)
-- Salt
-- Pepper
-- Butter
+def load_profile(path: str) -> dict:
+    """Stage distributions fitted to a benchmark.py report."""
+    with open(path, "r", encoding="utf-8") as f:
+        latency = json.load(f)["latency"]
+    profile = {}
+    for stage in STAGES:
+        stats = latency.get(stage)
+        if not stats or stats["p50_ms"] <= 0:
+            continue
+        # A lognormal's p95 is median * exp(1.645 sigma)
+        sigma = max(0.0, math.log(max(stats["p95_ms"], stats["p50_ms"]) / stats["p50_ms"]) / 1.645)
+        profile[stage] = ("lognormal", stats["p50_ms"], sigma)
+    return profile
 
-## Instructions:
-1. Beat eggs in a bowl with salt and pepper.
-2. Heat butter in a non-stick pan.
-3. Pour in egg mixture and cook for 1 minute.
-4. Add vegetables and cheese.
-5. Fold omelette and cook for another minute.
-6. Serve hot.
-"""
+
+def parse_latency_config(value: str) -> dict:
+    """``MOCK_LATENCY`` -> stage distributions; {} means no emulation."""
+    if not value or value.lower() in ("off", "0", "none"):
+        return {}
+    profile = dict(DEFAULT_STAGE_LATENCY)
+    for part in value.split(","):
+        part = part.strip()
+        if not part or part == "default":
+            continue
+        if part.startswith("profile:"):
+            profile.update(load_profile(part[len("profile:"):]))
+            continue
+        stage, _, spec = part.partition("=")
+        if stage not in profile:
+            raise ValueError(f"Unknown stage {stage!r} in MOCK_LATENCY, expected one of {list(STAGES)}")
+        kind, *params = spec.split(":")
+        profile[stage] = (kind, *(float(p) for p in params))
+        sample_ms(profile[stage])  # Fail at startup on a bad spec
+    return profile
+
+
+STAGE_LATENCY = parse_latency_config(os.environ.get("MOCK_LATENCY", ""))
+BURN_CPU = os.environ.get("MOCK_BURN", "sleep").lower() == "cpu"
+MAX_CONCURRENCY = int(os.environ.get("MOCK_MAX_CONCURRENCY", "0"))
+_slots = threading.BoundedSemaphore(MAX_CONCURRENCY) if MAX_CONCURRENCY > 0 else None
+# Moving average of request time, for the Retry-After estimate (as in jobs.JobQueue)
+_mean_run_s = 1.0
+
+
+def retry_after() -> int:
+    """Seconds until a slot is likely to free up.
+
+    JobQueue.retry_after's estimate (mean run time x backlog / workers) with
+    every slot busy: one mean request time.
+    """
+    return max(1, round(_mean_run_s))
+
+
+def spend(ms: float):
+    """Take ``ms`` of wall time, sleeping or spinning the CPU."""
+    seconds = ms / 1000.0
+    if not BURN_CPU:
+        time.sleep(seconds)
+        return
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def emulate_pipeline() -> list:
+    """Spend the time the real pipeline would; returns its stage report."""
+    sampled = {stage: sample_ms(dist) for stage, dist in STAGE_LATENCY.items()}
+    spend(sampled["decode"])
+    # Caption and detection run side by side
+    spend(max(sampled["caption"], sampled["detect"]))
+    spend(sampled["recipe"])
+    return [{"stage": stage, "ran": True, "ms": round(sampled[stage], 1)} for stage in STAGES]
+
+
+# Steps for recipes of varying length
+MOCK_STEPS = [
+    "Wash and chop the {item}.",
+    "Heat oil in a large pan and add the {item}.",
+    "Season the {item} with salt and pepper.",
+    "Simmer the {item} for 10 minutes, stirring occasionally.",
+    "Roast the {item} at 400°F (200°C) until golden, about 25 minutes.",
+    "Toss everything together with the {item} and adjust the seasoning.",
+    "Let the {item} rest for 5 minutes before serving.",
 ]
 
+def varied_recipe(ingredients: list) -> str:
+    """A recipe of random length built around ``ingredients``."""
+    title = f"# {ingredients[0].title()} with {ingredients[-1]}"
+    extras = random.sample(["Salt", "Pepper", "Olive oil", "Butter", "Fresh herbs", "Paprika"], random.randint(1, 4))
+    steps = [random.choice(MOCK_STEPS).format(item=random.choice(ingredients))
+             for _ in range(random.randint(3, 14))]
+    lines = [title, "", "## Ingredients:"] + [f"- {item.capitalize()}" for item in ingredients + extras]
+    lines += ["", "## Instructions:"] + [f"{n}. {step}" for n, step in enumerate(steps, 1)]
+    return "\n".join(lines) + "\n"
+
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({"status": "ok", "message": "Mock Food Vision API is running"})
@@ -148,22 +235,33 @@ def health_check():
 @app.route('/api/process-image', methods=['POST'])
 def process_image():
     try:
-        data = request.json
-        if not data or 'image' not in data:
-            return jsonify({"error": "No image data provided"}), 400
-        
-        # Decode the image
-        image_data = data['image']
-        if image_data.startswith('data:image'):
-            image_data = image_data.split(',')[1]
-        
-        image_bytes = base64.b64decode(image_data)
-        img = Image.open(io.BytesIO(image_bytes))
+        # Same upload forms and size limit as the real backend
+        read_image_upload(request, MAX_UPLOAD_BYTES)
+    except UploadError as e:
+        return jsonify({"error": str(e)}), e.status
+    
+    if _slots is None:
+        return _process()
+    if not _slots.acquire(blocking=False):
+        seconds = retry_after()
+        response = jsonify({"error": f"Server is busy, retry after {seconds}s", "retryAfter": seconds})
+        response.headers["Retry-After"] = str(seconds)
+        return response, 429
+    global _mean_run_s
+    start = time.perf_counter()
+    try:
+        return _process()
+    finally:
+        _mean_run_s = 0.8 * _mean_run_s + 0.2 * (time.perf_counter() - start)
+        _slots.release()
+
+def _process():
+    try:
+        stages = emulate_pipeline() if STAGE_LATENCY else None
         
-        # Check if the image contains potatoes by analyzing the image data
-        # For simplicity, we'll assume any image is a potato image
-        # In a real app, we would use image recognition here
-        is_potato_image = True
+        # Without latency emulation every image is treated as potatoes; with
+        # it, results vary so response sizes do too
+        is_potato_image = not STAGE_LATENCY
         
         if is_potato_image:
             # Use potato-specific ingredients and recipes
@@ -184,7 +282,7 @@ def process_image():
             # Use random ingredients and recipes for non-potato images
             num_ingredients = random.randint(3, 6)
             ingredients = random.sample(MOCK_INGREDIENTS, num_ingredients)
-            recipe = random.choice(MOCK_RECIPES)
+            recipe = varied_recipe(ingredients)
             caption = f"A delicious meal with {', '.join(ingredients[:-1])} and {ingredients[-1]}."
             
             # Create mock detection results
@@ -201,14 +299,17 @@ def process_image():
         # Create caption result in expected format
         caption_result = [{"generated_text": caption}]
         
-        return jsonify({
+        result = {
             "caption": caption,
             "ingredients": ingredients,
             "recipe": recipe,
             "detectionResults": detection_results,
             "foodKeywords": food_keywords,
             "captionResult": caption_result
-        })
+        }
+        if stages is not None:
+            result["stages"] = stages
+        return jsonify(result)
     
     except Exception as e:
         print(f"Error processing image: {str(e)}")
@@ -216,4 +317,6 @@ def process_image():
 
 if __name__ == '__main__':
     print("Starting Mock Food Vision API server...")
+    if STAGE_LATENCY:
+        print(f"Emulating latency ({'cpu' if BURN_CPU else 'sleep'}): {STAGE_LATENCY}, max concurrency {MAX_CONCURRENCY or 'unlimited'}")
     app.run(host='0.0.0.0', port=5001, debug=True)
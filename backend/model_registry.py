@@ -0,0 +1,100 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRegistry:
+    """Loads models on first use, or ahead of time on a warm-up thread.
+
+    Each model is registered with a loader that ``get`` calls with no
+    arguments. The food_vision loaders take an optional ``precision`` that
+    defaults to PRECISION_MODE; to load at another precision, register the
+    loader bound to it (as precision_check.py does with functools.partial).
+    ``get`` loads a model the first time it is asked for and caches the
+    result; concurrent callers wait on a per-model lock instead of loading
+    twice. Load time and any load error are recorded per model so the
+    readiness endpoint can report them.
+    """
+
+    def __init__(self):
+        self._loaders = {}
+        self._required = {}
+        self._models = {}
+        self._errors = {}
+        self._load_times = {}
+        self._locks = {}
+        self._warmup_thread = None
+
+    def register(self, name: str, loader, required: bool = True):
+        """Register a loader. Optional models do not block readiness if they fail."""
+        self._loaders[name] = loader
+        self._required[name] = required
+        self._locks[name] = threading.Lock()
+        self._models.pop(name, None)
+        self._errors.pop(name, None)
+        self._load_times.pop(name, None)
+
+    def get(self, name: str):
+        if name in self._models:
+            return self._models[name]
+        if name not in self._loaders:
+            raise KeyError(f"Unknown model: {name}")
+        with self._locks[name]:
+            if name in self._models:
+                return self._models[name]
+            if name in self._errors:
+                # Do not retry a failed load on every request
+                raise self._errors[name]
+            logger.info("Loading %s model...", name)
+            start = time.perf_counter()
+            try:
+                model = self._loaders[name]()
+            except Exception as e:
+                self._errors[name] = e
+                logger.warning("Could not load %s model: %s", name, e)
+                raise
+            self._load_times[name] = time.perf_counter() - start
+            self._models[name] = model
+            logger.info("Loaded %s model in %.1fs", name, self._load_times[name])
+            return model
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._models
+
+    def load_all(self):
+        """Load every registered model in the calling thread."""
+        for name in list(self._loaders):
+            try:
+                self.get(name)
+            except Exception:
+                pass  # recorded in self._errors
+
+    def warm_up(self) -> threading.Thread:
+        """Load every registered model on a background thread."""
+        if self._warmup_thread is None or not self._warmup_thread.is_alive():
+            self._warmup_thread = threading.Thread(target=self.load_all, name="model-warmup", daemon=True)
+            self._warmup_thread.start()
+        return self._warmup_thread
+
+    def ready(self) -> bool:
+        """True once every required model has loaded and every optional one has been attempted."""
+        for name in self._loaders:
+            if name in self._models:
+                continue
+            if name in self._errors and not self._required[name]:
+                continue
+            return False
+        return True
+
+    def status(self) -> dict:
+        models = {}
+        for name in self._loaders:
+            entry = {"loaded": name in self._models, "required": self._required[name]}
+            if name in self._load_times:
+                entry["load_time_s"] = round(self._load_times[name], 3)
+            if name in self._errors:
+                entry["error"] = str(self._errors[name])
+            models[name] = entry
+        return models
@@ -0,0 +1,191 @@
+"""ONNX Runtime inference backend for captioning and detection.
+
+Runs the graphs written by ``export_onnx.py`` on the CPU execution provider
+with full graph optimizations. Caption decoding feeds the decoder's
+key/value cache back in, so each step processes only the newest token
+(exports from before the cache was added still work, re-running the whole
+prefix on every step). Preprocessing, greedy decoding and DETR
+post-processing are done in numpy, and the tokenizer comes from the
+``tokenizers`` library, so this module never imports torch.
+
+Needs ``pip install onnxruntime``.
+"""
+import json
+import os
+
+import numpy as np
+import onnxruntime as ort
+from PIL import Image
+from tokenizers import Tokenizer
+
+from generation import DeadlineTracker, trim_to_boundary
+from vocabulary import food_label_table
+
+
+def _session(path: str) -> ort.InferenceSession:
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    threads = int(os.environ.get("ORT_NUM_THREADS", "0"))
+    if threads > 0:
+        options.intra_op_num_threads = threads
+    return ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+
+
+def _read_json(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _to_pil(image) -> Image.Image:
+    if isinstance(image, np.ndarray):
+        return Image.fromarray(image)
+    return image.convert("RGB")
+
+
+def _normalize(pixels: np.ndarray, rescale: float, mean, std) -> np.ndarray:
+    pixels = pixels.astype(np.float32) * rescale
+    pixels = (pixels - np.asarray(mean, dtype=np.float32)) / np.asarray(std, dtype=np.float32)
+    return pixels.transpose(2, 0, 1)  # HWC -> CHW
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    shifted = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    return shifted / shifted.sum(axis=-1, keepdims=True)
+
+
+class OnnxCaptioner:
+    def __init__(self, model_dir: str):
+        caption_dir = os.path.join(model_dir, "caption")
+        config = _read_json(os.path.join(model_dir, "onnx_config.json"))["caption"]
+        preprocessor = _read_json(os.path.join(caption_dir, "preprocessor_config.json"))
+        self.encoder = _session(os.path.join(caption_dir, "encoder.onnx"))
+        with_past = os.path.join(caption_dir, "decoder_with_past.onnx")
+        if os.path.exists(with_past):
+            self.decoder = _session(with_past)
+            self.past_names = [name for name in (i.name for i in self.decoder.get_inputs()) if name.startswith("past_")]
+            self.past_shape = (config["num_heads"], 0, config["head_dim"])
+        else:
+            self.decoder = _session(os.path.join(caption_dir, "decoder.onnx"))
+            self.past_names = None
+        self.tokenizer = Tokenizer.from_file(os.path.join(caption_dir, "tokenizer.json"))
+        self.decoder_start_token_id = config["decoder_start_token_id"]
+        self.eos_token_id = config["eos_token_id"]
+        self.pad_token_id = config.get("pad_token_id", self.eos_token_id)
+        size = preprocessor.get("size", 224)
+        if isinstance(size, int):
+            size = {"height": size, "width": size}
+        self.size = (size["width"], size["height"])
+        self.rescale = preprocessor.get("rescale_factor", 1 / 255)
+        self.mean = preprocessor.get("image_mean", [0.5, 0.5, 0.5])
+        self.std = preprocessor.get("image_std", [0.5, 0.5, 0.5])
+
+    def _preprocess(self, images: list) -> np.ndarray:
+        batch = [
+            _normalize(np.asarray(_to_pil(image).resize(self.size, Image.BILINEAR)), self.rescale, self.mean, self.std)
+            for image in images
+        ]
+        return np.stack(batch)
+
+    def caption(self, images: list, max_new_tokens: int = 63, deadline: float = None) -> list:
+        """Greedy decoding, matching the torch backend's generate defaults."""
+        (hidden,) = self.encoder.run(None, {"pixel_values": self._preprocess(images)})
+        batch_size = hidden.shape[0]
+        input_ids = np.full((batch_size, 1), self.decoder_start_token_id, dtype=np.int64)
+        finished = np.zeros(batch_size, dtype=bool)
+        tracker = DeadlineTracker(deadline, "caption")
+        past = None
+        if self.past_names is not None:
+            # Empty cache for the first step
+            empty = np.zeros((batch_size, *self.past_shape), dtype=np.float32)
+            past = {name: empty for name in self.past_names}
+        for _ in range(max_new_tokens):
+            if tracker.expired():
+                break
+            if past is None:
+                (logits,) = self.decoder.run(None, {"input_ids": input_ids, "encoder_hidden_states": hidden})
+            else:
+                outputs = self.decoder.run(None, {"input_ids": input_ids[:, -1:], "encoder_hidden_states": hidden, **past})
+                logits = outputs[0]
+                past = dict(zip(self.past_names, outputs[1:]))
+            next_tokens = np.where(finished, self.pad_token_id, logits[:, -1, :].argmax(-1))
+            input_ids = np.concatenate([input_ids, next_tokens[:, None].astype(np.int64)], axis=1)
+            finished |= next_tokens == self.eos_token_id
+            if finished.all():
+                break
+        captions = [text.strip() for text in self.tokenizer.decode_batch(input_ids.tolist(), skip_special_tokens=True)]
+        if tracker.triggered:
+            captions = [trim_to_boundary(caption) for caption in captions]
+        return captions
+
+
+class OnnxDetector:
+    def __init__(self, model_dir: str):
+        detection_dir = os.path.join(model_dir, "detection")
+        config = _read_json(os.path.join(model_dir, "onnx_config.json"))["detection"]
+        preprocessor = _read_json(os.path.join(detection_dir, "preprocessor_config.json"))
+        self.session = _session(os.path.join(detection_dir, "detr.onnx"))
+        size = preprocessor.get("size", 800)
+        if isinstance(size, int):
+            # Older configs store the longest edge separately as max_size
+            size = {"shortest_edge": size, "longest_edge": preprocessor.get("max_size", 1333)}
+        self.shortest_edge = size["shortest_edge"]
+        self.longest_edge = size["longest_edge"]
+        self.rescale = preprocessor.get("rescale_factor", 1 / 255)
+        self.mean = preprocessor.get("image_mean", [0.485, 0.456, 0.406])
+        self.std = preprocessor.get("image_std", [0.229, 0.224, 0.225])
+        # Same food-class table and mask as the torch backend
+        num_labels = config["num_labels"]
+        self.food_labels = food_label_table({int(k): v for k, v in config["id2label"].items()})
+        self.food_mask = np.zeros(num_labels, dtype=bool)
+        for label_id in self.food_labels:
+            if label_id < num_labels:
+                self.food_mask[label_id] = True
+
+    def _resized_hw(self, height: int, width: int) -> tuple:
+        # Shortest edge to shortest_edge, unless that pushes the longest past longest_edge
+        shortest = self.shortest_edge
+        short_side, long_side = min(height, width), max(height, width)
+        if long_side / short_side * shortest > self.longest_edge:
+            shortest = int(round(self.longest_edge * short_side / long_side))
+        if width <= height:
+            return int(shortest * height / width), shortest
+        return shortest, int(shortest * width / height)
+
+    def _preprocess(self, images: list) -> tuple:
+        resized = []
+        for image in images:
+            pil = _to_pil(image)
+            height, width = self._resized_hw(pil.height, pil.width)
+            resized.append(_normalize(np.asarray(pil.resize((width, height), Image.BILINEAR)), self.rescale, self.mean, self.std))
+        # Pad bottom/right to the largest image in the batch, as DetrImageProcessor does
+        max_h = max(p.shape[1] for p in resized)
+        max_w = max(p.shape[2] for p in resized)
+        pixel_values = np.zeros((len(resized), 3, max_h, max_w), dtype=np.float32)
+        pixel_mask = np.zeros((len(resized), max_h, max_w), dtype=np.int64)
+        for i, pixels in enumerate(resized):
+            pixel_values[i, :, :pixels.shape[1], :pixels.shape[2]] = pixels
+            pixel_mask[i, :pixels.shape[1], :pixels.shape[2]] = 1
+        return pixel_values, pixel_mask
+
+    def detect(self, images: list, threshold: float, top_k: int) -> list:
+        """Same contract as TorchDetector.detect."""
+        pixel_values, pixel_mask = self._preprocess(images)
+        (logits,) = self.session.run(None, {"pixel_values": pixel_values, "pixel_mask": pixel_mask})
+
+        probs = _softmax(logits)[..., :-1]
+        label_ids = probs.argmax(-1)
+        scores = np.take_along_axis(probs, label_ids[..., None], axis=-1)[..., 0]
+        keep = (scores > threshold) & self.food_mask[label_ids]
+        scores = np.where(keep, scores, 0.0)
+        top_queries = np.argsort(-scores, axis=-1)[:, :top_k]
+
+        batch_items = []
+        for image_scores, image_labels, queries in zip(scores, label_ids, top_queries):
+            detected = {}
+            for query in queries:
+                score = float(image_scores[query])
+                if score <= 0.0:
+                    break
+                detected.setdefault(self.food_labels[int(image_labels[query])], score)
+            batch_items.append(detected)
+        return batch_items
@@ -0,0 +1,106 @@
+"""Check how much a reduced-precision mode drifts from fp32.
+
+Runs captioning and detection over a sample image set twice, once in fp32
+and once in the requested mode, and reports caption and label agreement plus
+the speedup:
+
+    python precision_check.py --mode int8 path/to/sample_images
+"""
+import argparse
+import functools
+import json
+import os
+import time
+
+from PIL import Image
+
+import food_vision
+from inference import PRECISION_MODES
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def load_images(directory: str, limit: int) -> list:
+    paths = sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )[:limit]
+    return [(path, food_vision.prepare_image(Image.open(path))) for path in paths]
+
+
+def run_mode(mode: str, images: list) -> dict:
+    food_vision.registry.register("caption", functools.partial(food_vision._load_caption_model, mode))
+    food_vision.registry.register("detection", functools.partial(food_vision._load_detection_model, mode))
+    # Load up front so load time is not counted as inference time
+    food_vision.registry.get("caption")
+    food_vision.registry.get("detection")
+
+    captions, detections = [], []
+    start = time.perf_counter()
+    for _, pixels in images:
+        captions.append(food_vision.get_captions([pixels])[0])
+        detections.append(food_vision.detect_food_batch([pixels])[0])
+    elapsed = time.perf_counter() - start
+    return {"captions": captions, "detections": detections, "seconds": elapsed}
+
+
+def _jaccard(a: set, b: set) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def compare(reference: dict, candidate: dict) -> dict:
+    n = len(reference["captions"])
+    caption_exact = sum(r == c for r, c in zip(reference["captions"], candidate["captions"]))
+    caption_overlap = sum(
+        _jaccard(set(r.lower().split()), set(c.lower().split()))
+        for r, c in zip(reference["captions"], candidate["captions"])
+    )
+    label_exact = sum(set(r) == set(c) for r, c in zip(reference["detections"], candidate["detections"]))
+    label_overlap = sum(_jaccard(set(r), set(c)) for r, c in zip(reference["detections"], candidate["detections"]))
+    score_drift = [
+        abs(r[label] - c[label])
+        for r, c in zip(reference["detections"], candidate["detections"])
+        for label in set(r) & set(c)
+    ]
+    return {
+        "images": n,
+        "caption_exact_match": round(caption_exact / n, 4),
+        "caption_token_jaccard": round(caption_overlap / n, 4),
+        "label_set_exact_match": round(label_exact / n, 4),
+        "label_jaccard": round(label_overlap / n, 4),
+        "mean_score_drift": round(sum(score_drift) / len(score_drift), 4) if score_drift else 0.0,
+        "speedup": round(reference["seconds"] / candidate["seconds"], 3) if candidate["seconds"] else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", help="Directory of sample images")
+    parser.add_argument("--mode", choices=[m for m in PRECISION_MODES if m != "fp32"], required=True)
+    parser.add_argument("--limit", type=int, default=50, help="Maximum number of images to compare")
+    parser.add_argument("--show-diffs", action="store_true", help="Also print per-image disagreements")
+    args = parser.parse_args()
+
+    images = load_images(args.images, args.limit)
+    if not images:
+        parser.error(f"No images found in {args.images}")
+
+    reference = run_mode("fp32", images)
+    candidate = run_mode(args.mode, images)
+    report = {"mode": args.mode, **compare(reference, candidate)}
+
+    if args.show_diffs:
+        report["diffs"] = [
+            {"image": path, "fp32": [rc, sorted(rd)], args.mode: [cc, sorted(cd)]}
+            for (path, _), rc, cc, rd, cd in zip(
+                images, reference["captions"], candidate["captions"],
+                reference["detections"], candidate["detections"])
+            if rc != cc or set(rd) != set(cd)
+        ]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
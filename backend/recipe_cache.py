@@ -0,0 +1,97 @@
+import random
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_ingredients(ingredients: list) -> tuple:
+    """Canonical cache key for an ingredient list.
+
+    Case-folded, stripped, deduplicated and sorted, so
+    ``["Potato", "salt", "potato "]`` and ``["salt", "potato"]`` share a key.
+    """
+    return tuple(sorted({item.strip().casefold() for item in ingredients if item and item.strip()}))
+
+
+class RecipeCache:
+    """LRU + TTL cache of generated recipes keyed by ingredient set.
+
+    Each key can hold up to ``variants_per_key`` different recipes. Lookups
+    miss until that many variants have been collected, after which a random
+    variant is returned, so repeated dishes do not all get the identical
+    answer. Every variant records how long it took to generate, which shows
+    how much generation time the cache is saving.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600.0, variants_per_key: int = 1):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.variants_per_key = max(1, variants_per_key)
+        self._entries = OrderedDict()  # key -> list of variant dicts
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "saved_seconds": 0.0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _live_variants(self, key: tuple, now: float) -> list:
+        variants = self._entries.get(key)
+        if variants is None:
+            return []
+        if self.ttl_seconds > 0:
+            fresh = [v for v in variants if now - v["created_at"] < self.ttl_seconds]
+            if len(fresh) != len(variants):
+                self._counters["expirations"] += len(variants) - len(fresh)
+                if fresh:
+                    self._entries[key] = fresh
+                else:
+                    del self._entries[key]
+            variants = fresh
+        return variants
+
+    def get(self, ingredients: list):
+        """Return a cached recipe for this ingredient set, or None."""
+        if not self.enabled:
+            return None
+        key = normalize_ingredients(ingredients)
+        with self._lock:
+            variants = self._live_variants(key, time.time())
+            if len(variants) < self.variants_per_key:
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            variant = random.choice(variants)
+            variant["hits"] += 1
+            self._counters["hits"] += 1
+            self._counters["saved_seconds"] += variant["cost_s"]
+            return variant["recipe"]
+
+    def put(self, ingredients: list, recipe: str, cost_s: float, source: str = "model"):
+        if not self.enabled:
+            return
+        key = normalize_ingredients(ingredients)
+        if not key:
+            return
+        now = time.time()
+        with self._lock:
+            variants = self._live_variants(key, now)
+            variants.append({"recipe": recipe, "created_at": now, "cost_s": cost_s, "source": source, "hits": 0})
+            # Keep the newest variants if generation raced past the limit
+            self._entries[key] = variants[-self.variants_per_key:]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["saved_seconds"] = round(stats["saved_seconds"], 3)
+            stats["entries"] = len(self._entries)
+            stats["variants"] = sum(len(v) for v in self._entries.values())
+            costs = [v["cost_s"] for variants in self._entries.values() for v in variants]
+        stats["mean_generation_cost_s"] = round(sum(costs) / len(costs), 3) if costs else 0.0
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
@@ -0,0 +1,123 @@
+"""GPT-2 recipe generation with a cached prompt prefix and batched decoding.
+
+Every prompt starts with the same text (an optional few-shot preamble, then
+``"Recipe with ingredients:"``). Its key/value cache is computed once when
+the model loads and shared by every request, so a request only prefills its
+own ingredient tokens. Several requests can also be decoded together: their
+ingredient suffixes are padded to one length (pads sit between the shared
+prefix and each suffix, masked out), and one forward pass per step advances
+all of them.
+
+Decoding is greedy with no repeated bigrams, the same as the previous
+``generate`` call, and each sequence stops at EOS, its token budget or its
+own deadline.
+"""
+import torch
+from transformers import LogitsProcessorList, NoRepeatNGramLogitsProcessor
+
+from generation import DeadlineTracker
+from inference import inference_context
+
+PROMPT_PREFIX = "Recipe with ingredients:"
+
+
+def _to_legacy(past):
+    # Newer transformers return Cache objects; keep the plain tensors
+    return past.to_legacy_cache() if hasattr(past, "to_legacy_cache") else past
+
+
+class RecipeGenerator:
+    def __init__(self, model, tokenizer, preamble: str = ""):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.eos_token_id = tokenizer.eos_token_id
+        self.max_positions = getattr(model.config, "n_positions", 1024)
+        self.prefix_text = preamble + PROMPT_PREFIX
+        self.prefix_ids = tokenizer(self.prefix_text, return_tensors="pt")["input_ids"]
+        with inference_context(model):
+            outputs = model(self.prefix_ids, use_cache=True)
+        self._cache_cls = type(outputs.past_key_values) if hasattr(outputs.past_key_values, "to_legacy_cache") else None
+        self.prefix_past = _to_legacy(outputs.past_key_values)
+        self.prefix_length = self.prefix_ids.shape[1]
+
+    @staticmethod
+    def suffix(food_items: list) -> str:
+        # With PROMPT_PREFIX this spells out the same prompt as before:
+        # "Recipe with ingredients: a, b\n\n"
+        return f" {', '.join(food_items)}\n\n"
+
+    def prompt(self, food_items: list) -> str:
+        return self.prefix_text + self.suffix(food_items)
+
+    def _expanded_past(self, batch_size: int):
+        past = tuple(
+            tuple(t.expand(batch_size, *t.shape[1:]) for t in layer)
+            for layer in self.prefix_past
+        )
+        return self._cache_cls.from_legacy_cache(past) if self._cache_cls is not None else past
+
+    def generate(self, batch: list, max_new_tokens: int, deadlines: list = None, streamer=None) -> list:
+        """Generate one recipe per ``food_items`` list in ``batch``.
+
+        ``deadlines`` holds one DeadlineTracker (or None) per sequence.
+        ``streamer`` (a transformers streamer, batch size 1 only) receives
+        tokens as they are produced. Returns the generated texts, without
+        the prompt.
+        """
+        batch_size = len(batch)
+        trackers = deadlines or [None] * batch_size
+        trackers = [t if t is not None else DeadlineTracker(None, "recipe") for t in trackers]
+        suffixes = [self.tokenizer(self.suffix(items))["input_ids"] for items in batch]
+        width = max(len(ids) for ids in suffixes)
+        max_new_tokens = min(max_new_tokens, self.max_positions - self.prefix_length - width)
+
+        # Left-pad the suffixes so every row's last prompt token is aligned
+        pad = self.eos_token_id
+        suffix_ids = torch.tensor([[pad] * (width - len(ids)) + ids for ids in suffixes])
+        suffix_mask = torch.tensor([[0] * (width - len(ids)) + [1] * len(ids) for ids in suffixes])
+        attention_mask = torch.cat([torch.ones(batch_size, self.prefix_length, dtype=torch.long), suffix_mask], dim=1)
+        # Positions continue from the prefix, skipping the padding
+        position_ids = (attention_mask.cumsum(-1) - 1)[:, self.prefix_length:].clamp(min=0)
+        # Full sequences, for the no-repeat-ngram check (which, like generate,
+        # looks at the prompt too)
+        sequences = torch.cat([self.prefix_ids.expand(batch_size, -1), suffix_ids], dim=1)
+        processors = LogitsProcessorList([NoRepeatNGramLogitsProcessor(2)])
+
+        if streamer is not None:
+            streamer.put(sequences[0])  # Treated as the prompt (skip_prompt)
+        finished = torch.zeros(batch_size, dtype=torch.bool)
+        generated = []
+        with inference_context(self.model):
+            outputs = self.model(
+                input_ids=suffix_ids, past_key_values=self._expanded_past(batch_size),
+                attention_mask=attention_mask, position_ids=position_ids, use_cache=True,
+            )
+            for _ in range(max(0, max_new_tokens)):
+                scores = processors(sequences, outputs.logits[:, -1, :].float())
+                next_tokens = scores.argmax(-1)
+                next_tokens = torch.where(finished, torch.full_like(next_tokens, pad), next_tokens)
+                generated.append(next_tokens)
+                sequences = torch.cat([sequences, next_tokens[:, None]], dim=1)
+                if streamer is not None and not finished[0]:
+                    streamer.put(next_tokens[:1])
+
+                finished |= next_tokens == self.eos_token_id
+                for i, tracker in enumerate(trackers):
+                    if not finished[i] and tracker.expired():
+                        finished[i] = True
+                if finished.all():
+                    break
+
+                attention_mask = torch.cat([attention_mask, (~finished).long()[:, None]], dim=1)
+                position_ids = (attention_mask.sum(-1, keepdim=True) - 1)
+                outputs = self.model(
+                    input_ids=next_tokens[:, None], past_key_values=outputs.past_key_values,
+                    attention_mask=attention_mask, position_ids=position_ids, use_cache=True,
+                )
+        if streamer is not None:
+            streamer.end()
+
+        if not generated:
+            return [""] * batch_size
+        tokens = torch.stack(generated, dim=1).tolist()
+        return self.tokenizer.batch_decode(tokens, skip_special_tokens=True)
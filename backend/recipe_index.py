@@ -0,0 +1,297 @@
+"""Ingredient-indexed retrieval over a local recipe corpus.
+
+Instead of generating a recipe, look up real ones: every recipe in the
+corpus is reduced to a set of ingredient terms ("2 cups diced potatoes" ->
+"potato"), and an inverted index maps each term to the recipes using it.
+A query scores only the recipes sharing at least one term with it, by
+IDF-weighted Jaccard similarity, so rare ingredients count for more than
+salt and oil. Query terms the corpus never uses carry no weight: detector
+and caption output is noisy, and an unknown word says nothing about which
+recipe fits.
+
+The index is a directory of flat numpy arrays plus the recipes as JSONL,
+memory-mapped on load so pre-forked workers share the pages. Only the term
+table in meta.json is parsed into memory, so startup grows with the
+ingredient vocabulary but not with the number of recipes. Build it once
+from a JSONL or CSV corpus (``title``, ``ingredients``,
+``instructions``/``directions`` and, as in RecipeNLG, an optional ``NER``
+column of clean ingredient names):
+
+    python recipe_index.py build recipes.csv recipe_index/
+    python recipe_index.py query recipe_index/ potato onion cheese
+"""
+import argparse
+import csv
+import json
+import logging
+import mmap
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+from vocabulary import NON_INGREDIENT_TERMS, RECIPE_STOP_WORDS
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 2
+
+# Words in an ingredient line that are not the ingredient itself
+NON_INGREDIENT_WORDS = RECIPE_STOP_WORDS | NON_INGREDIENT_TERMS | frozenset([
+    "cup", "tablespoon", "tbsp", "teaspoon", "tsp", "ounce", "oz", "pound", "lb", "gram", "g", "kg",
+    "ml", "l", "liter", "litre", "quart", "pint", "pinch", "dash", "can", "jar", "package", "pkg",
+    "bag", "box", "bunch", "clove", "slice", "piece", "stick", "head", "sprig", "handful",
+    "large", "small", "medium", "whole", "half", "inch", "about", "plus", "more", "few",
+    "chopped", "diced", "minced", "sliced", "grated", "shredded", "peeled", "crushed", "cubed",
+    "melted", "softened", "beaten", "cooked", "drained", "rinsed", "trimmed", "halved", "quartered",
+    "fresh", "freshly", "ground", "finely", "thinly", "roughly", "coarsely", "lightly", "divided",
+    "optional", "taste", "needed", "into", "cut", "for", "or", "to", "at", "room", "temperature",
+    "serving", "garnish", "x",
+])
+
+_WORD = re.compile(r"[a-z]+")
+
+
+def singular(word: str) -> str:
+    """Crude English singular, enough to match "tomatoes" with "tomato"."""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith(("oes", "ches", "shes", "sses", "xes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us")):
+        return word[:-1]
+    return word
+
+
+def ingredient_terms(text: str) -> set:
+    """Index terms of one ingredient line or name."""
+    terms = set()
+    for word in _WORD.findall(text.lower()):
+        word = singular(word)
+        if len(word) > 1 and word not in NON_INGREDIENT_WORDS:
+            terms.add(word)
+    return terms
+
+
+def _as_list(value) -> list:
+    """A corpus field as a list of strings: a list, a JSON list, or lines."""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = value.strip()
+        if value.startswith("["):
+            try:
+                value = json.loads(value)
+            except json.JSONDecodeError:
+                pass
+        if isinstance(value, str):
+            value = re.split(r"\n|;", value)
+    return [str(item).strip() for item in value if str(item).strip()]
+
+
+def normalize_record(row: dict) -> dict:
+    """Corpus row -> ``{"title", "ingredients", "instructions", "terms"}``."""
+    ingredients = _as_list(row.get("ingredients"))
+    instructions = _as_list(row.get("instructions") or row.get("directions") or row.get("steps"))
+    # Clean ingredient names, when the corpus has them, beat parsing lines
+    names = _as_list(row.get("NER") or row.get("ner")) or ingredients
+    terms = set()
+    for name in names:
+        terms |= ingredient_terms(name)
+    return {
+        "title": (row.get("title") or row.get("name") or "Untitled recipe").strip(),
+        "ingredients": ingredients,
+        "instructions": instructions,
+        "terms": sorted(terms),
+    }
+
+
+def read_corpus(path: str):
+    """Yield raw rows from a JSONL or CSV corpus."""
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.lower().endswith(".csv"):
+            csv.field_size_limit(sys.maxsize)
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def build_index(corpus: str, index_dir: str, max_df: float = 0.5) -> dict:
+    """Build an index directory from a corpus file and return its metadata.
+
+    Terms used by more than ``max_df`` of all recipes (water, salt) are left
+    out: they barely move the scores and have the longest posting lists.
+    """
+    start = time.perf_counter()
+    os.makedirs(index_dir, exist_ok=True)
+    term_ids = {}
+    recipe_terms = []
+    record_offsets = [0]
+    with open(os.path.join(index_dir, "recipes.jsonl"), "wb") as out:
+        for row in read_corpus(corpus):
+            record = normalize_record(row)
+            if not record["terms"]:
+                continue
+            ids = [term_ids.setdefault(term, len(term_ids)) for term in record["terms"]]
+            recipe_terms.append(np.asarray(ids, dtype=np.int32))
+            line = json.dumps({key: record[key] for key in ("title", "ingredients", "instructions")}).encode("utf-8") + b"\n"
+            out.write(line)
+            record_offsets.append(record_offsets[-1] + len(line))
+
+    n_recipes = len(recipe_terms)
+    if not n_recipes:
+        raise ValueError(f"No recipes with ingredients found in {corpus}")
+    lengths = np.fromiter((len(t) for t in recipe_terms), dtype=np.int64, count=n_recipes)
+    term_column = np.concatenate(recipe_terms)
+    recipe_column = np.repeat(np.arange(n_recipes, dtype=np.int32), lengths)
+
+    df = np.bincount(term_column, minlength=len(term_ids))
+    kept = df <= max(1, max_df * n_recipes)
+    # Renumber the kept terms; dropped ones map to -1
+    new_ids = np.full(len(term_ids), -1, dtype=np.int64)
+    new_ids[kept] = np.arange(int(kept.sum()))
+    keep_rows = kept[term_column]
+    term_column = new_ids[term_column[keep_rows]]
+    recipe_column = recipe_column[keep_rows]
+    df = df[kept]
+
+    # CSR layout: postings[offsets[t]:offsets[t + 1]] are the recipes using term t
+    order = np.argsort(term_column, kind="stable")
+    postings = recipe_column[order]
+    offsets = np.zeros(len(df) + 1, dtype=np.int64)
+    np.cumsum(df, out=offsets[1:])
+    idf = (np.log((n_recipes + 1) / (df + 1)) + 1).astype(np.float32)
+    weights = np.bincount(recipe_column, weights=idf[term_column], minlength=n_recipes).astype(np.float32)
+
+    np.save(os.path.join(index_dir, "offsets.npy"), offsets)
+    np.save(os.path.join(index_dir, "postings.npy"), postings)
+    np.save(os.path.join(index_dir, "idf.npy"), idf)
+    np.save(os.path.join(index_dir, "weights.npy"), weights)
+    np.save(os.path.join(index_dir, "record_offsets.npy"), np.asarray(record_offsets, dtype=np.int64))
+    terms = [None] * len(df)
+    for term, old_id in term_ids.items():
+        if kept[old_id]:
+            terms[new_ids[old_id]] = term
+    meta = {
+        "version": INDEX_VERSION,
+        "recipes": n_recipes,
+        "terms": terms,
+        "dropped_terms": sorted(term for term, old_id in term_ids.items() if not kept[old_id]),
+        "build_seconds": round(time.perf_counter() - start, 2),
+    }
+    with open(os.path.join(index_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    return meta
+
+
+class RecipeIndex:
+    """A built index, memory-mapped. Safe to share between threads."""
+
+    def __init__(self, index_dir: str):
+        with open(os.path.join(index_dir, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != INDEX_VERSION:
+            raise ValueError(f"{index_dir} is index version {meta.get('version')}, expected {INDEX_VERSION}; rebuild it")
+        self.index_dir = index_dir
+        self.size = meta["recipes"]
+        self._term_ids = {term: i for i, term in enumerate(meta["terms"])}
+        self._dropped = frozenset(meta["dropped_terms"])
+
+        def load(name):
+            return np.load(os.path.join(index_dir, name), mmap_mode="r")
+
+        self.offsets = load("offsets.npy")
+        self.postings = load("postings.npy")
+        self.idf = load("idf.npy")
+        self.weights = load("weights.npy")
+        self.record_offsets = load("record_offsets.npy")
+        with open(os.path.join(index_dir, "recipes.jsonl"), "rb") as f:
+            self._records = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def record(self, recipe_id: int) -> dict:
+        start, end = self.record_offsets[recipe_id], self.record_offsets[recipe_id + 1]
+        return json.loads(self._records[start:end])
+
+    def search(self, ingredients: list, k: int = 5) -> list:
+        """The ``k`` recipes best matching ``ingredients``, best first.
+
+        Each match is the recipe record plus ``id`` and ``score`` (weighted
+        Jaccard similarity, 0 to 1).
+        """
+        terms = set()
+        for item in ingredients:
+            terms |= ingredient_terms(item)
+        terms -= self._dropped
+
+        query_weight = 0.0
+        ids, weights = [], []
+        for term in terms:
+            term_id = self._term_ids.get(term)
+            if term_id is None:
+                continue
+            weight = float(self.idf[term_id])
+            query_weight += weight
+            postings = self.postings[self.offsets[term_id]:self.offsets[term_id + 1]]
+            ids.append(postings)
+            weights.append(np.full(len(postings), weight, dtype=np.float32))
+        if not ids or k <= 0:
+            return []
+
+        # Only recipes sharing a term with the query are scored
+        candidates, inverse = np.unique(np.concatenate(ids), return_inverse=True)
+        overlap = np.bincount(inverse, weights=np.concatenate(weights))
+        scores = overlap / (query_weight + self.weights[candidates] - overlap)
+        k = min(k, len(candidates))
+        top = np.argpartition(-scores, k - 1)[:k]
+        # Best score first; ties go to the earlier recipe, so results are stable
+        top = top[np.lexsort((candidates[top], -scores[top]))]
+        return [dict(self.record(int(candidates[i])), id=int(candidates[i]), score=round(float(scores[i]), 4))
+                for i in top]
+
+
+def format_recipe(match: dict) -> str:
+    """A retrieved recipe as text, laid out like the template recipes."""
+    lines = [match["title"], "", "Ingredients:"]
+    lines += [f"- {item}" for item in match["ingredients"]]
+    lines += ["", "Instructions:"]
+    lines += [f"{n}. {step}" for n, step in enumerate(match["instructions"], 1)]
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Build an index directory from a JSONL or CSV corpus")
+    build.add_argument("corpus")
+    build.add_argument("index_dir")
+    build.add_argument("--max-df", type=float, default=0.5,
+                       help="Leave out terms used by more than this fraction of recipes")
+    query = commands.add_parser("query", help="Print the best matches for some ingredients")
+    query.add_argument("index_dir")
+    query.add_argument("ingredients", nargs="+")
+    query.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    from log_config import configure_logging
+    configure_logging()
+    if args.command == "build":
+        meta = build_index(args.corpus, args.index_dir, args.max_df)
+        logger.info("Indexed %d recipes, %d terms (%d common terms dropped) in %.1fs",
+                    meta["recipes"], len(meta["terms"]), len(meta["dropped_terms"]), meta["build_seconds"])
+        return
+
+    index = RecipeIndex(args.index_dir)
+    start = time.perf_counter()
+    matches = index.search(args.ingredients, args.k)
+    elapsed_us = (time.perf_counter() - start) * 1e6
+    for match in matches:
+        print(f"{match['score']:.3f}  {match['title']}")
+    print(f"{len(matches)} matches out of {index.size} recipes in {elapsed_us:.0f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+
+def content_key(image_bytes: bytes) -> str:
+    """Exact cache key: SHA-256 of the uploaded bytes."""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def perceptual_hash(image: Image.Image) -> int:
+    """64-bit difference hash (dHash).
+
+    The image is shrunk to 9x8 grayscale and each bit records whether a pixel
+    is brighter than its right-hand neighbour, so re-encodes, small resizes
+    and minor exposure changes map to the same or a nearby hash.
+    """
+    small = image.convert("L").resize((9, 8), Image.BILINEAR)
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            bits = (bits << 1) | (1 if left > right else 0)
+    return bits
+
+
+class ResultCache:
+    """LRU cache of processed-image results under a memory budget.
+
+    Entries are keyed by the exact content hash of the upload. When perceptual
+    matching is enabled, a lookup can also be satisfied by any cached entry
+    whose dHash is within ``phash_max_distance`` bits. If ``disk_dir`` is set,
+    every entry is also written there as JSON so the cache survives restarts;
+    memory misses fall through to disk before counting as a miss. The disk
+    tier is kept under ``max_disk_bytes`` by deleting the least recently
+    written or read files.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, disk_dir: str = None,
+                 use_perceptual_hash: bool = False, phash_max_distance: int = 4,
+                 max_disk_bytes: int = 512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.use_perceptual_hash = use_perceptual_hash
+        self.phash_max_distance = phash_max_distance
+        self._entries = OrderedDict()  # key -> (result, size, phash)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "perceptual_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0,
+                          "disk_evictions": 0}
+        self._disk_bytes = 0
+        self._sweep_lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_entries())
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 or bool(self.disk_dir)
+
+    def get(self, key: str, count_miss: bool = True):
+        """Exact-match lookup, memory first and then disk.
+
+        Pass ``count_miss=False`` when a ``get_similar`` lookup follows, so a
+        request is counted as one miss (or one perceptual hit), not two.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._counters["hits"] += 1
+                return entry[0]
+
+        result = self._read_disk(key)
+        with self._lock:
+            if result is None:
+                if count_miss:
+                    self._counters["misses"] += 1
+                return None
+            self._counters["disk_hits"] += 1
+            self._insert(key, result, None)
+            return result
+
+    def get_similar(self, phash: int):
+        """Perceptual lookup against the in-memory entries."""
+        if not self.use_perceptual_hash or phash is None:
+            return None
+        with self._lock:
+            best_key, best_distance = None, self.phash_max_distance + 1
+            for key, (_, _, entry_phash) in self._entries.items():
+                if entry_phash is None:
+                    continue
+                distance = bin(phash ^ entry_phash).count("1")
+                if distance < best_distance:
+                    best_key, best_distance = key, distance
+                    if distance == 0:
+                        break
+            if best_key is None:
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self._counters["perceptual_hits"] += 1
+            return self._entries[best_key][0]
+
+    def put(self, key: str, result: dict, phash: int = None):
+        with self._lock:
+            self._insert(key, result, phash)
+        self._write_disk(key, result)
+
+    def _insert(self, key: str, result: dict, phash: int):
+        if self.max_bytes <= 0:
+            return
+        size = len(json.dumps(result))
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old[1]
+        self._entries[key] = (result, size, phash)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self._counters["evictions"] += 1
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _read_disk(self, key: str):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                result = json.load(f)
+            # Recently read entries survive the next sweep
+            os.utime(path)
+            return result
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, key: str, result: dict):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(result, f)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Could not write result cache entry %s: %s", key, e)
+            return
+        with self._lock:
+            self._disk_bytes += size
+            over = 0 < self.max_disk_bytes < self._disk_bytes
+        if over:
+            self._sweep_disk()
+
+    def _disk_entries(self) -> list:
+        """``(mtime, size, path)`` of every entry file, oldest first."""
+        entries = []
+        try:
+            with os.scandir(self.disk_dir) as it:
+                for entry in it:
+                    if entry.name.endswith(".json"):
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            continue  # Removed by another process meanwhile
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            pass
+        entries.sort()
+        return entries
+
+    def _sweep_disk(self):
+        """Delete the oldest files until the disk tier is under 90% of its cap.
+
+        The directory is rescanned, so files written by other processes
+        sharing it are counted too.
+        """
+        if not self._sweep_lock.acquire(blocking=False):
+            return  # Another thread is already sweeping
+        try:
+            entries = self._disk_entries()
+            total = sum(size for _, size, _ in entries)
+            target = self.max_disk_bytes * 0.9
+            removed = 0
+            for _, size, path in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+            with self._lock:
+                self._disk_bytes = total
+                self._counters["disk_evictions"] += removed
+        finally:
+            self._sweep_lock.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._bytes
+            stats["max_bytes"] = self.max_bytes
+            if self.disk_dir:
+                stats["disk_bytes"] = self._disk_bytes
+                stats["max_disk_bytes"] = self.max_disk_bytes
+        lookups = stats["hits"] + stats["perceptual_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((lookups - stats["misses"]) / lookups, 4) if lookups else 0.0
+        return stats
@@ -0,0 +1,177 @@
+"""Production serving: load the models once, then fork worker processes.
+
+The parent process loads every model, moves torch weights into shared
+memory and freezes the garbage collector, then forks ``--workers`` children
+that all accept connections on one listening socket. The children inherit
+the weights without copying them, so each extra worker costs its own
+interpreter and activations, not another copy of ViT-GPT2, DETR and GPT-2:
+
+    python serve.py --workers 4 --torch-threads 2
+
+Dead workers are restarted; SIGINT/SIGTERM stop them all. Metrics and the
+in-memory result cache are per worker (use RESULT_CACHE_DIR to share the
+disk tier). A job runs in the worker that accepted it, but its status is
+written to a job store directory (JOB_STORE_DIR, or a temporary directory
+removed on exit), so polling /api/jobs/<id> works whichever worker answers.
+Jobs of a worker that dies are lost and stay "queued"/"running" until
+JOB_RESULT_TTL expires them.
+"""
+import argparse
+import gc
+import logging
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+
+from werkzeug.serving import make_server
+
+from app import app, job_queue
+from food_vision import INFERENCE_BACKEND, registry
+
+logger = logging.getLogger("serve")
+
+
+def _torch_modules(model) -> list:
+    # Loaded models are TorchCaptioner/TorchDetector/RecipeGenerator, each
+    # holding its torch module as ``.model``
+    import torch
+
+    candidates = [model, getattr(model, "model", None)]
+    return [m for m in candidates if isinstance(m, torch.nn.Module)]
+
+
+def share_model_memory():
+    """Move every loaded torch model's tensors into shared memory.
+
+    Forked children share the parent's pages copy-on-write anyway; shared
+    memory makes that explicit and keeps the weights shared even if a page
+    gets written to (allocator metadata, refcounts on neighbouring objects).
+    """
+    if INFERENCE_BACKEND != "torch":
+        return
+    for name, status in registry.status().items():
+        if not status.get("loaded"):
+            continue
+        for module in _torch_modules(registry.get(name)):
+            try:
+                module.share_memory()
+            except (RuntimeError, NotImplementedError) as e:
+                # Quantized packed weights cannot always be moved; they stay
+                # copy-on-write shared, which is still fine as long as nothing writes them.
+                logger.warning("Could not move %s model to shared memory: %s", name, e)
+
+
+def _memory_kb(pid: int) -> dict:
+    # Pss splits shared pages between the processes that map them, so the
+    # sum over workers is the real total
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line and not line.startswith(" "))
+        return {key: int(fields[key].split()[0]) for key in ("Rss", "Pss") if key in fields}
+    except (OSError, ValueError):
+        return {}
+
+
+def run_worker(sock: socket.socket, host: str, port: int, torch_threads: int, threaded: bool):
+    # Restore default signal handling inherited from the supervisor
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    if torch_threads and INFERENCE_BACKEND == "torch":
+        import torch
+        torch.set_num_threads(torch_threads)
+        torch.set_num_interop_threads(1)
+    server = make_server(host, port, app, threaded=threaded, fd=sock.fileno())
+    logger.info("Worker %d serving", os.getpid(), extra=_memory_kb(os.getpid()))
+    server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "5002")))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("SERVE_WORKERS", "2")))
+    parser.add_argument("--torch-threads", type=int, default=int(os.environ.get("TORCH_THREADS_PER_WORKER", "0")),
+                        help="Intra-op threads per worker (0 leaves torch's default)")
+    parser.add_argument("--no-threads", action="store_true",
+                        help="Handle one request at a time per worker instead of a thread per request")
+    args = parser.parse_args()
+
+    # Bind before loading so a taken port fails fast
+    sock = socket.socket(socket.AF_INET6 if ":" in args.host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(128)
+    sock.set_inheritable(True)
+
+    start = time.perf_counter()
+    registry.load_all()
+    if not registry.ready():
+        logger.error("Required models failed to load: %s", registry.status())
+        sys.exit(1)
+    share_model_memory()
+    # Objects that exist now are never collected in the children, so the
+    # collector does not touch (and un-share) their pages
+    gc.collect()
+    gc.freeze()
+    logger.info("Models loaded in %.1fs", time.perf_counter() - start, extra=_memory_kb(os.getpid()))
+
+    temp_store = None
+    if args.workers > 1 and job_queue.store_dir is None:
+        temp_store = tempfile.mkdtemp(prefix="recipesnap-jobs-")
+        job_queue.use_store(temp_store)
+
+    workers = {}
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(sock, args.host, args.port, args.torch_threads, not args.no_threads)
+            finally:
+                os._exit(1)
+        workers[pid] = time.monotonic()
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for _ in range(args.workers):
+        spawn()
+    logger.info("Serving on %s:%d with %d workers", args.host, args.port, args.workers)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        started = workers.pop(pid, None)
+        if stopping or started is None:
+            continue
+        logger.warning("Worker %d exited with status %d, restarting", pid, status)
+        if time.monotonic() - started < 1.0:
+            # Crashing on startup; avoid a tight restart loop
+            time.sleep(1.0)
+        spawn()
+    sock.close()
+    if temp_store is not None:
+        shutil.rmtree(temp_store, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
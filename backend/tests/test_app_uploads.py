@@ -0,0 +1,30 @@
+import io
+
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("cv2")
+pytest.importorskip("numpy")
+pytest.importorskip("PIL")
+
+import app as app_module
+
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+
+@pytest.mark.parametrize("endpoint", ["/api/process-image", "/api/jobs"])
+def test_oversized_multipart_upload_with_budget_is_413(client, endpoint):
+    # budget_ms is a form field, so reading it must not parse the oversized body first
+    body = b"\xff" * (app_module.MAX_UPLOAD_BYTES + 1)
+    response = client.post(endpoint, data={"budget_ms": "500", "image": (io.BytesIO(body), "big.jpg")},
+                           content_type="multipart/form-data")
+    assert response.status_code == 413
+    assert "maximum upload size" in response.get_json()["error"]
+
+
+def test_invalid_budget_is_400(client):
+    response = client.post("/api/process-image?budget_ms=-1", data=b"\xff\xd8", content_type="image/jpeg")
+    assert response.status_code == 400
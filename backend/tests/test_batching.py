@@ -0,0 +1,48 @@
+import threading
+
+import pytest
+
+from batching import MicroBatcher
+
+
+def test_concurrent_submits_share_a_batch():
+    calls = []
+    release = threading.Event()
+
+    def batch_fn(items):
+        calls.append(list(items))
+        release.wait(1)
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=4, max_wait_ms=50)
+    futures = [batcher.submit(i) for i in range(4)]
+    release.set()
+    assert [f.result(timeout=2) for f in futures] == [0, 2, 4, 6]
+    assert sum(len(batch) for batch in calls) == 4
+    assert len(calls) < 4
+
+
+def test_failed_batch_is_retried_per_item():
+    def batch_fn(items):
+        if "bad" in items:
+            raise ValueError("bad input")
+        return [item.upper() for item in items]
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=2, max_wait_ms=50)
+    good, bad = batcher.submit("good"), batcher.submit("bad")
+    assert good.result(timeout=2) == "GOOD"
+    with pytest.raises(ValueError):
+        bad.result(timeout=2)
+
+
+def test_short_result_list_fails_every_future():
+    batcher = MicroBatcher(lambda items: items[:-1], max_batch_size=2, max_wait_ms=50)
+    futures = [batcher.submit(1), batcher.submit(2)]
+    for future in futures:
+        with pytest.raises(RuntimeError, match="returned"):
+            future.result(timeout=2)
+
+
+def test_rejects_empty_batches():
+    with pytest.raises(ValueError):
+        MicroBatcher(lambda items: items, max_batch_size=0)
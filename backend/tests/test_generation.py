@@ -0,0 +1,24 @@
+import pytest
+
+from generation import trim_to_boundary
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Preheat the oven. Add the pot", "Preheat the oven."),
+    ("Roast Potatoes\n\n1. Preheat the oven to 375F.\n2. Peel the pot", "Roast Potatoes\n\n1. Preheat the oven to 375F."),
+    ("1. Boil water 2. Add the pot", "1. Boil water"),
+    ("1. Boil water.\n2.", "1. Boil water."),
+    ("Is it done? Taste it", "Is it done?"),
+])
+def test_cuts_back_to_last_complete_sentence_or_step(text, expected):
+    assert trim_to_boundary(text) == expected
+
+
+def test_text_without_a_boundary_is_kept():
+    assert trim_to_boundary(" a plate of food ") == "a plate of food"
+
+
+def test_step_numbers_are_not_sentence_ends():
+    for trimmed in (trim_to_boundary("1. Boil water 2. Add the pot"),
+                    trim_to_boundary("1. Preheat the oven to 375F.\n2. Peel the pot")):
+        assert not trimmed.rstrip().split()[-1].rstrip(".").isdigit()
@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from recipe_index import RecipeIndex, build_index
+
+CORPUS = [
+    {"title": "Cheesy Broccoli Potatoes",
+     "ingredients": ["4 large potatoes, cubed", "2 cups broccoli florets", "1 cup shredded cheddar cheese",
+                     "2 tablespoons butter", "Salt to taste"],
+     "directions": ["Boil the potatoes.", "Add the broccoli.", "Top with cheese and bake."]},
+    {"title": "Tomato Basil Pasta",
+     "ingredients": ["8 oz pasta", "3 tomatoes, diced", "Fresh basil", "2 tbsp olive oil", "Salt"],
+     "directions": ["Cook the pasta.", "Toss with tomatoes, basil and oil."]},
+    {"title": "Garlic Chicken",
+     "ingredients": ["2 chicken breasts", "4 cloves garlic, minced", "1 tbsp butter", "Salt"],
+     "directions": ["Brown the chicken.", "Add garlic and butter."]},
+    {"title": "Fruit Salad",
+     "ingredients": ["2 bananas, sliced", "1 apple, diced", "1 orange"],
+     "directions": ["Combine the fruit in a bowl."]},
+]
+
+# Default RECIPE_MATCH_MIN_SCORE in food_vision
+MIN_SCORE = 0.25
+
+
+@pytest.fixture
+def index(tmp_path):
+    corpus = tmp_path / "corpus.jsonl"
+    corpus.write_text("\n".join(json.dumps(row) for row in CORPUS) + "\n", encoding="utf-8")
+    build_index(str(corpus), str(tmp_path / "index"))
+    return RecipeIndex(str(tmp_path / "index"))
+
+
+def test_realistic_detector_output_matches_above_threshold(index):
+    # combine_ingredients output: caption words plus DETR labels, tableware included
+    ingredients = ["potato", "broccoli", "cheese", "fork", "knife", "spoon", "bowl", "bottle",
+                   "dining table", "food", "meal", "plate"]
+    matches = index.search(ingredients, k=2)
+    assert matches[0]["title"] == "Cheesy Broccoli Potatoes"
+    assert matches[0]["score"] >= MIN_SCORE
+
+
+def test_unknown_terms_do_not_dilute_the_score(index):
+    plain = index.search(["tomato", "basil", "pasta"], k=1)[0]
+    noisy = index.search(["tomato", "basil", "pasta", "laptop", "remote"], k=1)[0]
+    assert noisy["title"] == plain["title"] == "Tomato Basil Pasta"
+    assert noisy["score"] == plain["score"]
+
+
+def test_no_overlap_returns_nothing(index):
+    assert index.search(["fork", "knife", "dining table"]) == []
@@ -0,0 +1,20 @@
+from vocabulary import caption_matcher
+
+
+def test_multi_word_keyword_wins_over_the_word_inside_it():
+    caption = "a plate of food with olive oil and bell peppers"
+    # Word-by-word matching found only ['food', 'peppers']: "olive" and
+    # "bell" contain no keyword on their own.
+    assert caption_matcher.match_words(caption) == ["food", "olive oil", "bell peppers"]
+
+
+def test_single_words_still_match_by_substring():
+    assert caption_matcher.match_words("Roasted Potatoes and peppers") == ["potatoes", "peppers"]
+
+
+def test_repeated_matches_are_reported_once():
+    assert caption_matcher.match_words("rice and more rice with a bell pepper") == ["rice", "bell pepper"]
+
+
+def test_no_keywords():
+    assert caption_matcher.match_words("a person standing in a kitchen") == []
@@ -0,0 +1,88 @@
+"""Tiny randomly initialized stand-ins for the real models.
+
+They have the same architectures as ViT-GPT2, DETR and GPT-2 but a few
+thousand parameters each, and need no downloads. Outputs are meaningless,
+but every code path (batching, post-processing, generation, fallbacks)
+runs, so benchmarks and tooling work offline:
+
+    import food_vision, tiny_models
+    tiny_models.register_tiny_models(food_vision.registry)
+"""
+import torch
+from tokenizers import Tokenizer, models, pre_tokenizers
+from transformers import (
+    DetrConfig, DetrForObjectDetection, DetrImageProcessor,
+    GPT2Config, GPT2LMHeadModel, PreTrainedTokenizerFast, ResNetConfig,
+    ViTConfig, ViTImageProcessor, VisionEncoderDecoderConfig, VisionEncoderDecoderModel,
+)
+
+from recipe_generator import RecipeGenerator
+from torch_backend import TorchCaptioner, TorchDetector
+from vocabulary import CAPTION_FOOD_KEYWORDS, DETECTION_FOOD_TERMS
+
+SPECIAL_TOKENS = ["<|endoftext|>", "<unk>"]
+FILLER_WORDS = ["a", "the", "with", "and", "on", "of", "plate", "table", "recipe", "ingredients", "\n"]
+TINY_LABELS = ["N/A", "person", "banana", "pizza", "bowl", "dining table", "broccoli", "cup", "car", "chair"]
+
+# Same seed every time so benchmark runs are comparable across commits
+SEED = 0
+
+
+def tiny_tokenizer() -> PreTrainedTokenizerFast:
+    words = SPECIAL_TOKENS + sorted(set(FILLER_WORDS + [w for k in CAPTION_FOOD_KEYWORDS + DETECTION_FOOD_TERMS for w in k.split()]))
+    vocab = {word: i for i, word in enumerate(words)}
+    tokenizer = Tokenizer(models.WordLevel(vocab=vocab, unk_token="<unk>"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    return PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer, bos_token="<|endoftext|>", eos_token="<|endoftext|>",
+        pad_token="<|endoftext|>", unk_token="<unk>",
+    )
+
+
+def tiny_captioner() -> TorchCaptioner:
+    torch.manual_seed(SEED)
+    tokenizer = tiny_tokenizer()
+    encoder = ViTConfig(hidden_size=32, num_hidden_layers=1, num_attention_heads=2,
+                        intermediate_size=64, image_size=224, patch_size=32)
+    decoder = GPT2Config(n_embd=32, n_layer=1, n_head=2, n_positions=128, vocab_size=len(tokenizer),
+                         add_cross_attention=True, is_decoder=True,
+                         bos_token_id=tokenizer.bos_token_id, eos_token_id=tokenizer.eos_token_id)
+    model = VisionEncoderDecoderModel(VisionEncoderDecoderConfig.from_encoder_decoder_configs(encoder, decoder))
+    model.config.decoder_start_token_id = tokenizer.bos_token_id
+    model.config.pad_token_id = tokenizer.pad_token_id
+    model.config.eos_token_id = tokenizer.eos_token_id
+    processor = ViTImageProcessor(size={"height": 224, "width": 224})
+    return TorchCaptioner(model, processor, tokenizer)
+
+
+def tiny_detector() -> TorchDetector:
+    torch.manual_seed(SEED)
+    backbone = ResNetConfig(embedding_size=8, hidden_sizes=[8, 16, 16, 32], depths=[1, 1, 1, 1],
+                            out_features=["stage4"])
+    config = DetrConfig(
+        use_timm_backbone=False, use_pretrained_backbone=False, backbone_config=backbone,
+        d_model=32, encoder_layers=1, decoder_layers=1, encoder_attention_heads=2, decoder_attention_heads=2,
+        encoder_ffn_dim=64, decoder_ffn_dim=64, num_queries=20,
+        id2label=dict(enumerate(TINY_LABELS)), label2id={label: i for i, label in enumerate(TINY_LABELS)},
+    )
+    model = DetrForObjectDetection(config)
+    # Smaller than DETR's 800px default, to keep the tiny model cheap
+    processor = DetrImageProcessor(size={"shortest_edge": 256, "longest_edge": 448})
+    return TorchDetector(model, processor)
+
+
+def tiny_recipe_model() -> RecipeGenerator:
+    torch.manual_seed(SEED)
+    tokenizer = tiny_tokenizer()
+    config = GPT2Config(n_embd=32, n_layer=2, n_head=2, n_positions=512, vocab_size=len(tokenizer),
+                        bos_token_id=tokenizer.bos_token_id, eos_token_id=tokenizer.eos_token_id)
+    model = GPT2LMHeadModel(config).eval()
+    model.inference_precision = "fp32"
+    return RecipeGenerator(model, tokenizer)
+
+
+def register_tiny_models(registry):
+    """Replace the caption, detection and recipe loaders with tiny models."""
+    registry.register("caption", tiny_captioner)
+    registry.register("detection", tiny_detector)
+    registry.register("recipe", tiny_recipe_model, required=False)
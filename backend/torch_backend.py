@@ -0,0 +1,100 @@
+"""PyTorch inference backend for captioning and detection (the default)."""
+import torch
+from transformers import (
+    VisionEncoderDecoderModel, ViTImageProcessor, AutoTokenizer,
+    DetrForObjectDetection, DetrImageProcessor,
+)
+
+from generation import DeadlineTracker, deadline_criteria, trim_to_boundary
+from inference import inference_context, prepare_model
+from vocabulary import food_label_table
+
+
+class TorchCaptioner:
+    def __init__(self, model, processor, tokenizer, precision: str = "fp32"):
+        self.model = prepare_model(model, precision)
+        self.processor = processor
+        self.tokenizer = tokenizer
+
+    @classmethod
+    def from_pretrained(cls, model_name: str, precision: str = "fp32") -> "TorchCaptioner":
+        # Image Captioning
+        return cls(
+            VisionEncoderDecoderModel.from_pretrained(model_name),
+            ViTImageProcessor.from_pretrained(model_name),
+            AutoTokenizer.from_pretrained(model_name),
+            precision,
+        )
+
+    def caption(self, images: list, max_new_tokens: int = 63, deadline: float = None) -> list:
+        """Caption a batch of images with a single generate call.
+
+        Decoding stops early at ``deadline`` (a ``time.perf_counter()`` value),
+        returning the captions decoded so far.
+        """
+        inputs = self.processor(images=images, return_tensors="pt").pixel_values
+        kwargs = {"max_new_tokens": max_new_tokens}
+        tracker = None
+        if deadline is not None:
+            tracker = DeadlineTracker(deadline, "caption")
+            kwargs["stopping_criteria"] = deadline_criteria(tracker)
+        with inference_context(self.model):
+            outputs = self.model.generate(inputs, **kwargs)
+        captions = self.tokenizer.batch_decode(outputs, skip_special_tokens=True)
+        if tracker is not None and tracker.triggered:
+            captions = [trim_to_boundary(caption) for caption in captions]
+        return captions
+
+
+class TorchDetector:
+    def __init__(self, model, processor, precision: str = "fp32"):
+        self.model = prepare_model(model, precision)
+        self.processor = processor
+        # Precompute which DETR classes are food: a label table for the final
+        # lookup and a boolean mask over the logits for tensor-level filtering.
+        num_labels = self.model.config.num_labels
+        self.food_labels = food_label_table(self.model.config.id2label)
+        self.food_mask = torch.zeros(num_labels, dtype=torch.bool)
+        for label_id in self.food_labels:
+            if label_id < num_labels:
+                self.food_mask[label_id] = True
+
+    @classmethod
+    def from_pretrained(cls, model_name: str, precision: str = "fp32") -> "TorchDetector":
+        # Object Detection
+        return cls(
+            DetrForObjectDetection.from_pretrained(model_name),
+            DetrImageProcessor.from_pretrained(model_name),
+            precision,
+        )
+
+    def detect(self, images: list, threshold: float, top_k: int) -> list:
+        """Run DETR over a batch of images in one forward pass.
+
+        Returns one ``{label: score}`` dict per image, highest score first.
+        Score threshold, food-class mask and top-k are applied as tensor ops
+        to the logits for the whole batch; only the survivors become Python
+        values.
+        """
+        inputs = self.processor(images=images, return_tensors="pt")
+        with inference_context(self.model):
+            outputs = self.model(**inputs)
+
+        # Drop the trailing "no object" class, then take each query's best class
+        probs = outputs.logits.float().softmax(-1)[..., :-1]
+        scores, label_ids = probs.max(-1)
+        keep = (scores > threshold) & self.food_mask[label_ids]
+        scores = scores.masked_fill(~keep, 0.0)
+        top_scores, top_queries = scores.topk(min(top_k, scores.shape[-1]), dim=-1)
+        top_labels = label_ids.gather(-1, top_queries)
+
+        batch_items = []
+        for image_scores, image_labels in zip(top_scores.tolist(), top_labels.tolist()):
+            # Scores are sorted, so the first hit per label is its best score
+            detected = {}
+            for score, label_id in zip(image_scores, image_labels):
+                if score <= 0.0:
+                    break
+                detected.setdefault(self.food_labels[label_id], score)
+            batch_items.append(detected)
+        return batch_items
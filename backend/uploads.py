@@ -0,0 +1,74 @@
+import base64
+import binascii
+
+from werkzeug.exceptions import RequestEntityTooLarge
+
+DEFAULT_MAX_UPLOAD_BYTES = 20 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """A client-side problem with the uploaded image, with the HTTP status to return."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def _read_limited(stream, max_bytes: int) -> bytes:
+    # Read in chunks so an oversized body is rejected as soon as it crosses
+    # the limit instead of after it has been buffered in full.
+    buf = bytearray()
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        buf += chunk
+        if len(buf) > max_bytes:
+            raise UploadError(f"Image exceeds the maximum upload size of {max_bytes} bytes", 413)
+    return bytes(buf)
+
+
+def read_image_upload(req, max_bytes: int = DEFAULT_MAX_UPLOAD_BYTES) -> bytes:
+    """Return the raw image bytes from a Flask request.
+
+    Accepted forms, cheapest first:
+      * multipart/form-data with the file in the ``image`` field
+      * a raw binary body (``image/*`` or ``application/octet-stream``)
+      * legacy JSON ``{"image": "<base64 or data URL>"}``
+
+    Requests whose declared Content-Length is over ``max_bytes`` are rejected
+    before any of the body is read.
+    """
+    if req.content_length is not None and req.content_length > max_bytes:
+        raise UploadError(f"Image exceeds the maximum upload size of {max_bytes} bytes", 413)
+
+    mimetype = req.mimetype or ""
+    try:
+        if mimetype == "multipart/form-data":
+            upload = req.files.get("image")
+            if upload is None:
+                raise UploadError("No image file provided")
+            return _read_limited(upload.stream, max_bytes)
+
+        if mimetype.startswith("image/") or mimetype == "application/octet-stream":
+            image_bytes = _read_limited(req.stream, max_bytes)
+            if not image_bytes:
+                raise UploadError("No image data provided")
+            return image_bytes
+    except RequestEntityTooLarge:
+        raise UploadError(f"Image exceeds the maximum upload size of {max_bytes} bytes", 413)
+
+    # Legacy clients send base64 inside a JSON body
+    data = req.get_json(silent=True)
+    if not data or "image" not in data:
+        raise UploadError("No image data provided")
+
+    image_data = data["image"]
+    if image_data.startswith("data:image"):
+        # Remove the prefix if present (e.g., 'data:image/jpeg;base64,')
+        image_data = image_data.split(",", 1)[1]
+    try:
+        return base64.b64decode(image_data)
+    except (binascii.Error, ValueError):
+        raise UploadError("Invalid base64 image data")
@@ -0,0 +1,148 @@
+"""Shared food vocabulary for all backends.
+
+Every food/non-food decision goes through this module so the full backend,
+the lite backend and the mock cannot drift apart. Keyword lookups use a
+precompiled Aho-Corasick automaton: one pass over the text finds every
+keyword it contains, instead of testing each keyword against each word.
+"""
+import bisect
+import re
+from collections import deque
+
+# Concrete ingredients we expect to see in captions and recipes
+INGREDIENT_KEYWORDS = [
+    "potato", "tomato", "onion", "garlic", "chicken", "beef", "carrot",
+    "broccoli", "spinach", "rice", "pasta", "cheese", "egg", "mushroom",
+    "bell pepper", "olive oil", "salt", "pepper", "basil", "oregano",
+]
+
+# Caption words that mark a food item (ingredients plus generic food words)
+CAPTION_FOOD_KEYWORDS = INGREDIENT_KEYWORDS + ["food", "dish", "meal", "vegetable", "fruit", "meat"]
+
+# Detector labels that are food or could be food
+DETECTION_FOOD_TERMS = [
+    "banana", "apple", "sandwich", "orange", "broccoli", "carrot", "hot dog", "pizza",
+    "donut", "cake", "bowl", "cup", "fork", "knife", "spoon", "food", "fruit", "vegetable",
+    "potato", "tomato", "onion", "garlic", "pepper", "rice", "pasta", "bread", "cheese",
+    "meat", "chicken", "beef", "pork", "fish", "egg", "milk", "butter", "oil", "salt",
+    "bottle", "plate", "dining table",
+]
+
+# Detector labels and caption words that pass the food filters but are
+# tableware or generic, never a recipe ingredient
+NON_INGREDIENT_TERMS = frozenset([
+    "bowl", "cup", "fork", "knife", "spoon", "bottle", "plate", "dining", "table",
+    "food", "fruit", "vegetable", "meal", "dish",
+])
+
+# Words that are never ingredients, even if they slip through matching
+CAPTION_STOP_WORDS = frozenset(["a", "the", "and", "with", "of", "in", "on", "plate", "bowl", "dish", "image"])
+# Filler words the lite backend drops from captions (it keeps every other
+# word longer than three letters)
+LITE_CAPTION_STOP_WORDS = frozenset(["with", "and", "the", "that", "this", "there", "their", "they", "them"])
+RECIPE_STOP_WORDS = frozenset([
+    "person", "people", "man", "woman", "child", "boy", "girl",
+    "a", "the", "and", "with", "of", "in", "on",
+])
+
+
+class KeywordMatcher:
+    """Aho-Corasick multi-pattern matcher over lower-cased text.
+
+    Matching costs O(len(text) + matches) regardless of how many keywords
+    there are.
+    """
+
+    def __init__(self, keywords: list):
+        self.keywords = tuple(dict.fromkeys(k.lower() for k in keywords if k))
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        for keyword in self.keywords:
+            self._insert(keyword)
+        self._build_failure_links()
+
+    def _insert(self, keyword: str):
+        state = 0
+        for ch in keyword:
+            next_state = self._goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][ch] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            state = next_state
+        self._out[state] = self._out[state] + (keyword,)
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(ch, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._out[next_state] = self._out[next_state] + self._out[self._fail[next_state]]
+
+    def finditer(self, text: str):
+        """Yield ``(start, end, keyword)`` for every keyword occurrence in ``text``."""
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for i, ch in enumerate(text.lower()):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for keyword in out[state]:
+                yield i - len(keyword) + 1, i + 1, keyword
+
+    def contains_any(self, text: str) -> bool:
+        for _ in self.finditer(text):
+            return True
+        return False
+
+    def match_words(self, text: str) -> list:
+        """Whitespace-delimited words of ``text`` that contain a keyword.
+
+        A keyword that spans several words ("olive oil") returns the whole
+        span, and a match inside a longer matched span ("pepper" in "bell
+        peppers") is dropped. Results are unique, lower-cased, in order of
+        appearance.
+        """
+        text = text.lower()
+        spans = [m.span() for m in re.finditer(r"\S+", text)]
+        starts = [start for start, _ in spans]
+        ranges = set()
+        for start, end, _ in self.finditer(text):
+            first = bisect.bisect_right(starts, start) - 1
+            last = bisect.bisect_right(starts, end - 1) - 1
+            if first >= 0:
+                ranges.add((first, last))
+        words = []
+        covered = -1
+        for first, last in sorted(ranges, key=lambda r: (r[0], -r[1])):
+            if last <= covered:
+                continue
+            covered = last
+            words.append(text[spans[first][0]:spans[last][1]])
+        return list(dict.fromkeys(words))
+
+
+caption_matcher = KeywordMatcher(CAPTION_FOOD_KEYWORDS)
+detection_matcher = KeywordMatcher(DETECTION_FOOD_TERMS)
+
+
+def is_food_label(label: str) -> bool:
+    return detection_matcher.contains_any(label)
+
+
+def food_label_table(id2label: dict) -> dict:
+    """Map detector class ids to labels, keeping only food-related classes.
+
+    Built once per model at load time so per-detection filtering is a dict
+    lookup.
+    """
+    return {int(label_id): label for label_id, label in id2label.items() if is_food_label(label)}